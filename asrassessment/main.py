@@ -1,48 +1,77 @@
 #Main functions for plotting 
 
 #global imports 
+#(plotly, matplotlib, scipy and pandas are imported in the plotting functions, so importing the package stays fast)
 import numpy as np
-import pandas as pd
-from glob import glob
-from tqdm import tqdm
-
-import plotly.graph_objects as go
-import plotly.express as px
 from collections import OrderedDict
-from scipy.io.wavfile import read
-import matplotlib.pyplot as plt
 
 #local imports
 from .utils.standardizer import read_phn,TIMIT_to_IPA,IPA_to_TIMIT
 from .utils.phone_error_rate import error_rate, load_asr_dict,compare_phonemes_perc,compare_phn_wrd_noise_multi
+from .utils.box_stats import phoneme_box_stats
+from .utils.phoneme_accuracy import PhonemeAccuracyAccumulator
 
 
-def phn_boxplot(phn_counter_dict, styling_outliers = 'suspectedoutliers'):
+def phn_boxplot(phn_counter_dict, styling_outliers = 'suspectedoutliers', stats = False, max_outliers = 50,
+                export_path = "my_plot.eps", show = True):
 
   ### <Purpose of function>: Plot boxplot
   ### <Input variables>    : phn_counter_dict = Dictionary containing phoneme as key and list of % correctly predicted phonemes as value.
+  ###                                           (or a PhonemeAccuracyAccumulator, always plotted as with stats = True)
   ###                        styling_outliers = All Points - "all" / 
   ###                                           Only Whiskers - False / 
   ###                                           Suspected Outliers - suspectedoutliers /
   ###                                           Whiskers and Outliers - "outliers"
   ###                                           (Default set to "Suspected Outliers", full detail: https://plotly.com/python/box-plots/)
-  ### <Output>             : Boxplot
+  ###                        stats = True to compute quartiles/whiskers with numpy (utils.box_stats) and give plotly only
+  ###                                these numbers and at most max_outliers outliers per phoneme, so the figure size does
+  ###                                not grow with the number of recordings (styling_outliers False hides the outliers)
+  ###                        export_path = file the figure is written to (format from the extension), None to not export
+  ###                        show = False to not display the figure (i.e. headless export)
+  ### <Output>             : Boxplot, returns the plotly figure
+
+  import plotly.graph_objects as go
 
   #Initiate
   fig = go.Figure()
   
-  #Maintain order of dictionary as written 
-  ordered_dict = OrderedDict(phn_counter_dict.items())
-
-  for key in ordered_dict:
-    fig.add_trace(go.Box(
-        y=ordered_dict[key],
-        name=key,
-        boxpoints= styling_outliers,
-        marker=dict(
-            line=dict(
-                outliercolor='rgba(219, 64, 82, 0.6)'
-    ))))
+  #accumulator: box statistics estimated from its histograms
+  if isinstance(phn_counter_dict, PhonemeAccuracyAccumulator):
+    stats = True
+    boxes = phn_counter_dict.box_stats(max_outliers = max_outliers)
+  else:
+    #Maintain order of dictionary as written 
+    ordered_dict = OrderedDict(phn_counter_dict.items())
+    boxes = phoneme_box_stats(ordered_dict, max_outliers = max_outliers) if stats else None
+
+  if stats:
+    for key, box in boxes.items():
+      if box is None:
+        continue
+      fig.add_trace(go.Box(
+          x=[key],
+          name=key,
+          q1=[box['q1']], median=[box['median']], q3=[box['q3']], mean=[box['mean']],
+          lowerfence=[box['lowerfence']], upperfence=[box['upperfence']],
+          showlegend=False))
+      if styling_outliers is not False and box['outliers']:
+        fig.add_trace(go.Scatter(
+            x=[key] * len(box['outliers']),
+            y=box['outliers'],
+            mode='markers',
+            name=key,
+            showlegend=False,
+            marker=dict(color='rgba(219, 64, 82, 0.6)')))
+  else:
+    for key in ordered_dict:
+      fig.add_trace(go.Box(
+          y=ordered_dict[key],
+          name=key,
+          boxpoints= styling_outliers,
+          marker=dict(
+              line=dict(
+                  outliercolor='rgba(219, 64, 82, 0.6)'
+      ))))
 
   #x-axis
   fig.update_layout(title_text=f"Phoneme Accuracy Rate")
@@ -56,8 +85,11 @@ def phn_boxplot(phn_counter_dict, styling_outliers = 'suspectedoutliers'):
           title_text = "Accuracy (%)",
           title_standoff = 25)
   
-  fig.write_image("my_plot.eps", format="eps")
-  fig.show()
+  if export_path is not None:
+    fig.write_image(export_path, format=export_path.rsplit('.', 1)[-1])
+  if show:
+    fig.show()
+  return fig
 
 def noise_stacked_boxplot(error_rate_df,
                           dimension,
@@ -69,6 +101,8 @@ def noise_stacked_boxplot(error_rate_df,
   ### <Input variables>     : error_rate_df = dataframe with Columns ("Volume", "Error Rate (%)", "Type of Error")
   ### <Output>              : Stacked boxplot
 
+  import plotly.express as px
+
   fig = px.bar(error_rate_df, x = x_axis, y = y_axis, color = type_error, barmode = 'stack')
   fig.update_layout(
     margin=dict(l=dimension[0], r=dimension[1], t=dimension[2], b=dimension[3]),
@@ -83,11 +117,23 @@ def full_phn_boxplot(asr_model,
                      TIMIT_dict,
                      file_set="TRAIN",
                      DR=[0,None],
-                     styling_outliers = False):
-    asr_dict = load_asr_dict(TIMIT_dict=TIMIT_dict,asr_model=asr_model,DR=DR,file_set=file_set)
-    phn_counter_dict = compare_phonemes_perc(TIMIT_dict=TIMIT_dict,asr_dict=asr_dict,DR=DR,file_set=file_set)
+                     styling_outliers = False,
+                     stats = False,
+                     max_outliers = 50,
+                     export_path = "my_plot.eps",
+                     show = True,
+                     accumulator = None,
+                     **asr_options):
+    #TIMIT_dict can also be a manifest (utils.manifest.build_manifest)
+    #stats/max_outliers/export_path/show: see phn_boxplot (stats = True for a large set, i.e. the full TRAIN set)
+    #accumulator: see compare_phonemes_perc (True, or a PhonemeAccuracyAccumulator of other runs to add this run to)
+    #asr_options (i.e. cache, model_id) are passed to utils.phone_error_rate func load_asr_dict
+    asr_dict = load_asr_dict(TIMIT_dict=TIMIT_dict,asr_model=asr_model,DR=DR,file_set=file_set,**asr_options)
+    phn_counter_dict = compare_phonemes_perc(TIMIT_dict=TIMIT_dict,asr_dict=asr_dict,DR=DR,file_set=file_set,
+                                             accumulator=accumulator)
 
-    return phn_boxplot(phn_counter_dict,styling_outliers=styling_outliers)
+    return phn_boxplot(phn_counter_dict,styling_outliers=styling_outliers,stats=stats,max_outliers=max_outliers,
+                       export_path=export_path,show=show)
 
 def full_noise_stackedplot(audio_dict,
                             noise_wav,
@@ -98,9 +144,13 @@ def full_noise_stackedplot(audio_dict,
                             DR = [0,None],
                             SPK = [0,None],
                             louder_volumes=[],
-                            softer_volumes=[]):
+                            softer_volumes=[],
+                            file_set = None,
+                            **asr_options):
 
     #Full description of inputs is in utils.phone error_rate func compare_phn_wrd_noise_multi
+    #audio_dict can also be a manifest (utils.manifest.build_manifest), file_set then selects "TRAIN"/"TEST"
+    #asr_options (i.e. cache, phn_model_id, txt_model_id) are passed to compare_phn_wrd_noise_multi
     error_rate_df = compare_phn_wrd_noise_multi(audio_dict = audio_dict,
                                                 noise_wav = noise_wav,
                                                 cfg_filedir = cfg_filedir,
@@ -109,69 +159,105 @@ def full_noise_stackedplot(audio_dict,
                                                 DR = DR,
                                                 SPK = SPK,
                                                 louder_volumes = louder_volumes,
-                                                softer_volumes = softer_volumes)
-    return noise_stacked_boxplot(dimension, error_rate_df)
+                                                softer_volumes = softer_volumes,
+                                                file_set = file_set,
+                                                **asr_options)
+    return noise_stacked_boxplot(error_rate_df, dimension)
 
-#Function to plot wav graph showing phoneme per time and error occur at which frames
-def phoneme_wavchart(timit_phndir, timit_wavdir,asr_model,vlinecolor='grey',print_df=False):
+#Function to reduce audio to a min/max envelope of about width points (what is visible at width pixels)
+def wav_envelope(data, width = 2000):
 
-  phn_file = timit_phndir
-  samplerate, data = read(timit_wavdir)
+  ### <Output variable>: Returns (x, y) to plot as one line, every sample if the audio has less than 2 * width samples (or width is None)
+  data = np.asarray(data)
+  if width is None or len(data) <= 2 * width:
+    return np.arange(len(data)), data
+  bin_size = int(np.ceil(len(data) / width))
+  n_bins = len(data) // bin_size
+  bins = data[:n_bins * bin_size].reshape(n_bins, bin_size)
+  lows, highs = bins.min(axis=1), bins.max(axis=1)
+  if n_bins * bin_size < len(data):
+    lows = np.append(lows, data[n_bins * bin_size:].min())
+    highs = np.append(highs, data[n_bins * bin_size:].max())
 
-  time = np.arange(0,len(data))
+  #every bin drawn as a vertical segment from its min to its max
+  x = np.repeat(np.arange(len(lows)) * bin_size, 2)
+  y = np.empty(2 * len(lows), dtype = data.dtype)
+  y[0::2], y[1::2] = lows, highs
+  return x, y
 
-  #initiate plot
-  plt.figure(figsize=(20,10))
-  plt.plot(time,data)
+#Function drawing the phoneme_wavchart on a matplotlib axis
+def _draw_wavchart(ax, timit_phndir, timit_wavdir, asr_output, vlinecolor = 'grey', width = 2000):
+
+  ### <Output>: Returns (sampling rate, merged_df of the TIMIT phonemes with the error found for each)
+  import pandas as pd
+  from .utils.data_input import read_audio
+
+  data, samplerate = read_audio(timit_wavdir)
+  ax.plot(*wav_envelope(data, width), linewidth = 0.8)
+
+  #parse phn file once
+  phn_df = read_phn(timit_phndir,df=True)
 
   #set up vlines
-  list_timing = read_phn(phn_file,df=True)['end'].tolist()
-  list_phn    = read_phn(phn_file,df=True)['phoneme'].tolist()
-  list_timing = [int(i) for i in list_timing]
-  plt.vlines(x=list_timing,ymin=-35000,ymax=35000,colors = vlinecolor,linestyle='dotted')
+  list_timing = phn_df['end'].tolist()
+  list_phn    = phn_df['phoneme'].tolist()
+  ax.vlines(x=list_timing,ymin=-35000,ymax=35000,colors = vlinecolor,linestyle='dotted')
   for i,timing in enumerate(list_timing):
-    plt.text(timing,-36000,timing,rotation=90,horizontalalignment='right')
+    ax.text(timing,-36000,timing,rotation=90,horizontalalignment='right')
     if i%2 == 0:
-      plt.text(timing,35000,list_phn[i],verticalalignment = 'top',horizontalalignment='center', fontsize='x-large')
+      ax.text(timing,35000,list_phn[i],verticalalignment = 'top',horizontalalignment='center', fontsize='x-large')
     else:
-      plt.text(timing,33000,list_phn[i],verticalalignment = 'top',horizontalalignment='center', fontsize='x-large')
+      ax.text(timing,33000,list_phn[i],verticalalignment = 'top',horizontalalignment='center', fontsize='x-large')
 
   ### plot highlights of wrong area
-  timittest = TIMIT_to_IPA(read_phn(phn_file,string=True))[1:-1]     #TIMIT phn #[1:-1] to remove the '/' 
-  asrtest = IPA_to_TIMIT(asr_model(timit_wavdir,dataframe=False)) #ASR phn
+  timittest = TIMIT_to_IPA('/'.join(list_phn))[1:-1]                 #TIMIT phn #[1:-1] to remove the '/' 
+  asrtest = IPA_to_TIMIT(asr_output)                                  #ASR phn
 
-  error_rate_df,tracker_df = error_rate(timittest,asrtest)           #get tracker_df
+  error_rate_df,alignment = error_rate(timittest,asrtest,tracker='alignment')
+  tracker_df = alignment.to_df()                                     #get tracker_df
   tracker_df.index+=1                                                #shift index of tracker_df up by 1
 
-  timit_phn = read_phn(phn_file,df=True).iloc[1:-1]                  #timit phn (dataframe)
+  timit_phn = phn_df.iloc[1:-1]                                      #timit phn (dataframe)
   merged_df = pd.concat([timit_phn,tracker_df],axis=1)               #concat left df
 
-  merged_df['start'] = merged_df['start'].astype(int)                #convert string to int
-  merged_df['end'] = merged_df['end'].astype(int)
   merged_df.columns = ['start','end','phoneme','initial_phoneme','error','substituted'] # rename col name
 
-  #select for substitution errors
-  sub_df = merged_df[merged_df['error'] == 'Substitution'][['start','end']]
-  for i in range(len(sub_df)):
-    if i==0:
-      plt.axvspan(sub_df.iloc[i][0], sub_df.iloc[i][1], color='orange', alpha=0.4,label='substituted')
-    else:
-      plt.axvspan(sub_df.iloc[i][0], sub_df.iloc[i][1], color='orange', alpha=0.4)
-
-  #select for deletion errors
-  del_df = merged_df[merged_df['error'] == 'Deletion'][['start','end']]
-  for i in range(len(del_df)):
-    if i==0:
-      plt.axvspan(del_df.iloc[i][0], del_df.iloc[i][1], color='red', alpha=0.4,label='deleted')
-    else:
-      plt.axvspan(del_df.iloc[i][0], del_df.iloc[i][1], color='red', alpha=0.4)
+  #substitution/deletion errors, one collection of spans (full height of the axis) per type of error
+  for error, color, label in [('Substitution', 'orange', 'substituted'), ('Deletion', 'red', 'deleted')]:
+    spans = merged_df[merged_df['error'] == error][['start','end']].to_numpy(dtype = float)
+    if len(spans):
+      ax.broken_barh(list(zip(spans[:,0], spans[:,1] - spans[:,0])), (0, 1), transform = ax.get_xaxis_transform(),
+                     facecolors = color, alpha = 0.4, label = label)
 
   #labels
-  plt.xlabel(f'Time [{samplerate} frame/s]')
-  plt.ylabel('Amplitude') 
-  plt.title('Plot showing phonemes per frame')
-  plt.legend(bbox_to_anchor=(1.05, 1),loc='center')
-  plt.show()
+  ax.set_xlabel(f'Time [{samplerate} frame/s]')
+  ax.set_ylabel('Amplitude') 
+  ax.set_title('Plot showing phonemes per frame')
+  if ax.get_legend_handles_labels()[0]:
+    ax.legend(bbox_to_anchor=(1.05, 1),loc='center')
+  return samplerate, merged_df
+
+#Function to plot wav graph showing phoneme per time and error occur at which frames
+def phoneme_wavchart(timit_phndir, timit_wavdir,asr_model,vlinecolor='grey',print_df=False,width=2000,output_path=None,show=True):
+
+  ### width = number of points the audio is reduced to (min/max envelope), None to plot every sample
+  ### output_path = optional image file the chart is saved to, show = False to not display it
+
+  import matplotlib.pyplot as plt
+  from .utils.data_input import model_input
+  from .utils.scheduler import call_model
+
+  #initiate plot (call_model: a @batched model gets a list of one input)
+  fig = plt.figure(figsize=(20,10))
+  asr_output = call_model(asr_model, [model_input(asr_model, timit_wavdir)], dataframe=False)[0]
+  samplerate, merged_df = _draw_wavchart(fig.gca(), timit_phndir, timit_wavdir, asr_output,
+                                         vlinecolor = vlinecolor, width = width)
+  if output_path is not None:
+    fig.savefig(output_path, bbox_inches = 'tight')
+  if show:
+    plt.show()
+  else:
+    plt.close(fig)
   
   if print_df == True:
     print("Dataframe Showing Substitution")
@@ -180,3 +266,42 @@ def phoneme_wavchart(timit_phndir, timit_wavdir,asr_model,vlinecolor='grey',prin
     print("Dataframe Showing Deletion")
     print(merged_df[merged_df['error'] == 'Deletion'][['start','end','phoneme']])
 
+#render one chart to a file without pyplot (no display needed, safe in worker processes)
+def _render_wavchart(timit_phndir, timit_wavdir, asr_output, output_path, vlinecolor, width):
+  from matplotlib.figure import Figure
+
+  fig = Figure(figsize=(20,10))
+  _draw_wavchart(fig.add_subplot(), timit_phndir, timit_wavdir, asr_output, vlinecolor = vlinecolor, width = width)
+  fig.savefig(output_path, bbox_inches = 'tight')
+  return output_path
+
+#Function to save the phoneme_wavchart of many recordings as image files
+def phoneme_wavchart_batch(files, asr_model, output_dir, vlinecolor='grey', width=2000, image_format='png', workers=None):
+
+  ### <Purpose of function>: phoneme_wavchart for many recordings, rendered in parallel (headless) to image files
+  ### <Input variables>    : files = list of (timit .phn directory, timit .wav directory)
+  ###                        asr_model = ASR model, called once per recording with dataframe=False (input as in load_asr_dict)
+  ###                        output_dir = folder for the images, named DR_speaker_utterance.image_format
+  ###                        workers = number of processes rendering the charts (None = number of CPUs, 1 = in this process)
+  ### <Output>             : Returns list of the image files, in the order of files
+
+  import os
+  from concurrent.futures import ProcessPoolExecutor
+  from .utils.scheduler import call_model
+  from .utils.data_input import model_input
+
+  os.makedirs(output_dir, exist_ok = True)
+  #samples for audio_input models, a .wav copy readable by any library otherwise (as load_asr_dict)
+  asr_outputs = call_model(asr_model, [model_input(asr_model, wav) for phn, wav in files], dataframe = False)
+  output_paths = []
+  for phn, wav in files:
+    parts = os.path.normpath(wav).split(os.sep)[-3:]
+    parts[-1] = os.path.splitext(parts[-1])[0]
+    output_paths.append(os.path.join(output_dir, f"{'_'.join(parts)}.{image_format}"))
+
+  args = [[phn for phn, wav in files], [wav for phn, wav in files], asr_outputs, output_paths,
+          [vlinecolor] * len(files), [width] * len(files)]
+  if workers == 1 or len(files) <= 1:
+    return list(map(_render_wavchart, *args))
+  with ProcessPoolExecutor(max_workers = workers) as pool:
+    return list(pool.map(_render_wavchart, *args))
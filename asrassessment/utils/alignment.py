@@ -0,0 +1,193 @@
+#Array based edit distance engine used by phone_error_rate.error_rate
+
+#global imports
+import numpy as np
+
+#operation codes (same as the ones used by the backtrace in error_rate)
+OP_OK = 0
+OP_SUB = 1
+OP_INS = 2
+OP_DEL = 3
+
+#Function to turn token sequences into integer ID arrays sharing a single vocabulary
+def encode_tokens(*sequences, vocab = None):
+
+  ### <Purpose of function>: Intern tokens so that sequences can be compared as integers
+  ### <Input variables>:     sequences = lists of tokens (i.e. ['sh','iy','hh'])
+  ###                        vocab = optional dictionary {token:id} to reuse/extend between calls
+  ### <Output variable>:     Returns list of int32 numpy arrays (one per sequence) and the vocab used
+
+  if vocab is None:
+    vocab = {}
+  encoded = []
+  for seq in sequences:
+    ids = np.empty(len(seq), dtype = np.int32)
+    for k, token in enumerate(seq):
+      ids[k] = vocab.setdefault(token, len(vocab))
+    encoded.append(ids)
+  return encoded, vocab
+
+#Function to build the backtrace matrix with one vectorised pass per reference row
+def levenshtein_backtrace(r, h):
+
+  ### <Purpose of function>: Same Levenshtein DP as error_rate, but each row is computed with numpy
+  ### <Input variables>:     r = reference token IDs (numpy int array)
+  ###                        h = hypothesis token IDs (numpy int array)
+  ### <Output variable>:     Returns backtrace matrix (int8) of shape (len(r)+1, len(h)+1) holding OP_* codes
+  ###
+  ### The insertion term depends on the cell to its left, so a row cannot be computed with a single
+  ### elementwise min. Writing best[j] = min(substitution/match, deletion) the row is
+  ### costs[j] = min_k<=j (best[k] + j - k), which is a running minimum of (best - j) shifted back by j.
+
+  n, m = len(r), len(h)
+  backtrace = np.empty((n+1, m+1), dtype = np.int8)
+  backtrace[0, 0] = OP_OK
+  backtrace[0, 1:] = OP_INS
+  backtrace[1:, 0] = OP_DEL
+  if n == 0 or m == 0:
+    return backtrace
+
+  #only the costs are computed row by row, the operations of every cell are derived from them at once afterwards.
+  #The rows are kept shifted (costs[i, j] - j): the running minimum then needs no shift back and forth per row
+  mismatch = np.not_equal.outer(r, h)  #substitution cost (0 when the tokens match)
+  diag_step = mismatch - 2              #substitution/match cost - 1 on the shifted rows, before the +1 below
+  cols = np.arange(m+1)
+  shifted = np.empty((n+1, m+1), dtype = cols.dtype)
+  shifted[0] = 0
+  best = np.empty(m+1, dtype = cols.dtype)
+
+  for i in range(1, n+1):
+    prev = shifted[i-1]
+    np.add(prev[:-1], diag_step[i-1], out = best[1:])
+    np.minimum(best[1:], prev[1:], out = best[1:])
+    best[1:] += 1                                         #min(substitution/match, deletion)
+    best[0] = i
+    np.minimum.accumulate(best, out = shifted[i])         #insertions
+  costs = shifted + cols
+
+  #operations, with the same tie-breaking order as error_rate (match, substitution, insertion, deletion)
+  cur = costs[1:, 1:]
+  ops = np.where(cur == costs[:-1, :-1] + mismatch, OP_SUB, np.where(cur == costs[1:, :-1] + 1, OP_INS, OP_DEL))
+  ops[~mismatch] = OP_OK
+  backtrace[1:, 1:] = ops
+  return backtrace
+
+#Function to walk the backtrace matrix from the last cell back to the origin
+def walk_backtrace(backtrace, n, m):
+
+  ### <Purpose of function>: Follow the best route through a backtrace matrix
+  ### <Input variables>:     backtrace = matrix (numpy array or list of lists) of OP_* codes
+  ###                        n, m = length of reference and hypothesis
+  ### <Output variable>:     Returns list of (operation, reference index, hypothesis index) from the end to the start
+
+  #python lists: indexing a numpy matrix cell by cell makes a view and a numpy scalar per step
+  if isinstance(backtrace, np.ndarray):
+    backtrace = backtrace.tolist()
+  i, j = n, m
+  route = []
+  while i > 0 or j > 0:
+    op = backtrace[i][j]
+    if op == OP_OK or op == OP_SUB:
+      i -= 1
+      j -= 1
+    elif op == OP_INS:
+      j -= 1
+    else:
+      i -= 1
+    route.append((op, i, j))
+  return route
+
+#Function to count the operations on the best route without keeping the route
+def count_ops(backtrace, n, m):
+
+  ### <Purpose of function>: Count correct/substitution/insertion/deletion on the best route
+  ### <Output variable>:     Returns tuple (correct, substitution, insertion, deletion)
+
+  if isinstance(backtrace, np.ndarray):
+    backtrace = backtrace.tolist()
+  counts = [0, 0, 0, 0]
+  i, j = n, m
+  while i > 0 or j > 0:
+    op = backtrace[i][j]
+    counts[op] += 1
+    if op == OP_OK or op == OP_SUB:
+      i -= 1
+      j -= 1
+    elif op == OP_INS:
+      j -= 1
+    else:
+      i -= 1
+  return tuple(counts)
+
+#Worker used by phone_error_rate.error_rate_batch (kept here so process pools only import numpy)
+def score_chunk(pairs):
+
+  ### <Purpose of function>: Score a list of (reference IDs, hypothesis IDs) pairs
+  ### <Output variable>:     Returns int64 array of shape (len(pairs), 4) with the OP_* counts of each pair
+
+  out = np.zeros((len(pairs), 4), dtype = np.int64)
+  for k, (r, h) in enumerate(pairs):
+    out[k] = count_ops(levenshtein_backtrace(r, h), len(r), len(h))
+  return out
+
+#Compact alignment between a reference and a hypothesis
+class Alignment:
+
+  ### <Purpose of class>: Hold the best route as arrays of op codes and token indices (start to end)
+  ###                     and only build the pandas tracker dataframe when asked for it
+  ### <Attributes>:       ops     = int8 array of OP_* codes
+  ###                     ref_idx = index into ref of each op (for insertions: the reference position it comes before)
+  ###                     hyp_idx = index into hyp of each op (for deletions: the hypothesis position it comes before)
+  ###                     ref/hyp = token lists that were aligned
+
+  __slots__ = ('ops', 'ref_idx', 'hyp_idx', 'ref', 'hyp')
+
+  def __init__(self, ops, ref_idx, hyp_idx, ref, hyp):
+    self.ops = ops
+    self.ref_idx = ref_idx
+    self.hyp_idx = hyp_idx
+    self.ref = ref
+    self.hyp = hyp
+
+  @classmethod
+  def from_backtrace(cls, backtrace, ref, hyp):
+    route = walk_backtrace(backtrace, len(ref), len(hyp))[::-1]
+    ops = np.array([step[0] for step in route], dtype = np.int8)
+    ref_idx = np.array([step[1] for step in route], dtype = np.int32)
+    hyp_idx = np.array([step[2] for step in route], dtype = np.int32)
+    return cls(ops, ref_idx, hyp_idx, ref, hyp)
+
+  def __len__(self):
+    return len(self.ops)
+
+  def counts(self):
+    ### Returns tuple (correct, substitution, insertion, deletion)
+    return tuple(int(c) for c in np.bincount(self.ops, minlength = 4)[:4])
+
+  def to_df(self):
+    ### Returns the tracker dataframe of error_rate: one row per reference token with columns
+    ### (phoneme, error, substituted), 'NIL' where the token was correctly predicted
+    import pandas as pd
+
+    error = np.full(len(self.ref), 'NIL', dtype = object)
+    substituted = np.full(len(self.ref), 'NIL', dtype = object)
+
+    sub = self.ops == OP_SUB
+    error[self.ref_idx[sub]] = 'Substitution'
+    substituted[self.ref_idx[sub]] = [self.hyp[j] for j in self.hyp_idx[sub]]
+    error[self.ref_idx[self.ops == OP_DEL]] = 'Deletion'
+
+    return pd.DataFrame({'phoneme': list(self.ref), 'error': error.tolist(), 'substituted': substituted.tolist()})
+
+  def phoneme_counts(self):
+    ### Returns dictionary with reference token as key and [num of correct, num of wrong] as value,
+    ### wrong being a substitution or deletion of that token (same output format as sequence_match)
+    counter = {}
+    for op, i in zip(self.ops.tolist(), self.ref_idx.tolist()):
+      if op == OP_INS:
+        continue
+      token = self.ref[i]
+      if token not in counter:
+        counter[token] = [0, 0]
+      counter[token][op != OP_OK] += 1
+    return counter
@@ -0,0 +1,132 @@
+#Persistent cache of ASR model outputs, keyed by the audio content and a model identifier
+
+#global imports
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+
+#local imports
+from .generalfunc import cache_dir
+from .scheduler import batched, is_batch_model, audio_input, takes_audio, call_batch
+
+#returned by ASRCache.get when there is no entry (None can be a valid model output)
+MISSING = object()
+
+class ASRCache:
+
+  ### <Purpose of class>: Store the output of an ASR model for an audio file so that unchanged files are not run again
+  ### <Input variables>:  path      = sqlite file of the cache (default ~/.cache/asrassessment/asr_cache.sqlite)
+  ###                     max_bytes = size bound of the stored outputs, least recently used entries are evicted first
+  ###
+  ### An entry is keyed by sha256(model_id + audio bytes), so editing/replacing an audio file or changing
+  ### model_id (i.e. new model version/settings) never returns a stale output. model_id is always given by the user.
+
+  def __init__(self, path = None, max_bytes = 256 * 1024**2):
+    if path is None:
+      path = os.path.join(cache_dir(), 'asr_cache.sqlite')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    self.path = path
+    self.max_bytes = max_bytes
+    with self._connect() as conn:
+      conn.execute("CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)")
+      conn.execute("CREATE INDEX IF NOT EXISTS outputs_last_used ON outputs (last_used)")
+
+  @contextmanager
+  def _connect(self):
+    #one connection per call, so the cache can be shared by threads and processes
+    conn = sqlite3.connect(self.path, timeout = 60)
+    try:
+      with conn:
+        yield conn
+    finally:
+      conn.close()
+
+  @staticmethod
+  def key(audio, model_id):
+    ### audio = file directory, bytes of the audio or numpy array of the samples
+    digest = hashlib.sha256(str(model_id).encode() + b'\0')
+    if isinstance(audio, np.ndarray):
+      digest.update(np.ascontiguousarray(audio).view(np.uint8))
+    elif isinstance(audio, (bytes, bytearray, memoryview)):
+      digest.update(audio)
+    else:
+      with open(audio, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+          digest.update(block)
+    return digest.hexdigest()
+
+  def get(self, key):
+    with self._connect() as conn:
+      row = conn.execute("SELECT value FROM outputs WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        return MISSING
+      conn.execute("UPDATE outputs SET last_used = ? WHERE key = ?", (time.time(), key))
+    return pickle.loads(row[0])
+
+  def put(self, key, value):
+    blob = pickle.dumps(value)
+    with self._connect() as conn:
+      conn.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+      self._evict(conn)
+
+  def _evict(self, conn):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    for key, size in conn.execute("SELECT key, size FROM outputs ORDER BY last_used").fetchall():
+      conn.execute("DELETE FROM outputs WHERE key = ?", (key,))
+      total -= size
+      if total <= self.max_bytes:
+        break
+
+  def __len__(self):
+    with self._connect() as conn:
+      return conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+  def clear(self):
+    with self._connect() as conn:
+      conn.execute("DELETE FROM outputs")
+
+  def cached(self, asr_model, model_id = None):
+    ### Returns function file_dir -> asr_model(file_dir), only running asr_model for audio not seen before
+    ### (for a batch model, see scheduler.batched: function list of file_dir -> list of outputs)
+    ### (for a model taking audio, see scheduler.audio_input: the cached model also takes audio, keyed by the samples)
+    ### model_id = identifier of the model and its settings (required, see require_model_id)
+    model_id = require_model_id(model_id)
+    mark_input = audio_input(asr_model.audio_dtype) if takes_audio(asr_model) else (lambda model: model)
+
+    if is_batch_model(asr_model):
+      def cached_batch_model(file_dirs):
+        return self.run(asr_model, file_dirs, model_id, batch = True)
+      return mark_input(batched(getattr(asr_model, 'max_batch_size', None), getattr(asr_model, 'max_batch_duration', None))(cached_batch_model))
+
+    def cached_model(file_dir):
+      return self.run(asr_model, [file_dir], model_id)[0]
+    return mark_input(cached_model)
+
+  def run(self, asr_model, inputs, model_id, batch = False):
+    ### Returns list of asr_model outputs of inputs (file directories or audio), only running asr_model for the inputs
+    ### not in the cache and storing their outputs
+    ### batch = True to call asr_model once with the list of inputs not in the cache (batch model, see scheduler.batched)
+    keys = [self.key(item, model_id) for item in inputs]
+    outputs = [self.get(key) for key in keys]
+    todo = [i for i, output in enumerate(outputs) if output is MISSING]
+    if todo:
+      todo_inputs = [inputs[i] for i in todo]
+      new_outputs = call_batch(asr_model, todo_inputs) if batch else [asr_model(item) for item in todo_inputs]
+      for i, output in zip(todo, new_outputs):
+        outputs[i] = output
+        self.put(keys[i], output)
+    return outputs
+
+#the cache needs a model identifier from the user: a name taken from the model cannot tell apart two partials,
+#two instances of one class or the same function with other weights, and would return another model's outputs
+def require_model_id(model_id, argument = 'model_id'):
+  if model_id is None:
+    raise ValueError(f"{argument} is required when a cache is given: an identifier of the model and its settings "
+                     f"(i.e. 'wav2vec2-base-960h-v2'), used to key the cached outputs")
+  return model_id
@@ -0,0 +1,42 @@
+#Box plot statistics computed with numpy, so a box plot of many values only carries a few numbers per box
+
+#global imports
+import numpy as np
+
+#Function to compute the statistics plotly draws for one box
+def box_stats(values, whisker = 1.5, max_outliers = 50):
+
+  ### <Purpose of function>: Quartiles, whiskers and outliers of values, same definitions as plotly go.Box
+  ###                        (linear quartiles, whiskers at the furthest values within whisker * IQR of the box)
+  ### <Input variables>:     values = list/array of numbers
+  ###                        whisker = whisker length as a multiple of the interquartile range
+  ###                        max_outliers = maximum number of outliers kept (evenly spaced over the sorted outliers,
+  ###                                       the smallest and largest are always kept), None to keep every outlier
+  ### <Output variable>:     Returns dictionary (q1, median, q3, mean, lowerfence, upperfence, outliers, n),
+  ###                        None if values is empty
+
+  values = np.asarray(values, dtype = np.float64)
+  values = values[~np.isnan(values)]
+  if len(values) == 0:
+    return None
+  values = np.sort(values)
+
+  q1, median, q3 = np.percentile(values, [25, 50, 75])
+  iqr = q3 - q1
+  inside = values[(values >= q1 - whisker * iqr) & (values <= q3 + whisker * iqr)]
+  lowerfence, upperfence = inside[0], inside[-1]
+
+  outliers = values[(values < lowerfence) | (values > upperfence)]
+  if max_outliers is not None and len(outliers) > max_outliers:
+    outliers = outliers[np.unique(np.linspace(0, len(outliers) - 1, max_outliers).round().astype(np.int64))]
+
+  return {'q1': float(q1), 'median': float(median), 'q3': float(q3), 'mean': float(values.mean()),
+          'lowerfence': float(lowerfence), 'upperfence': float(upperfence),
+          'outliers': outliers.tolist(), 'n': int(len(values))}
+
+#Function to compute box_stats for every phoneme of a phn_counter_dict
+def phoneme_box_stats(phn_counter_dict, whisker = 1.5, max_outliers = 50):
+
+  ### <Input variables>: phn_counter_dict = Dictionary containing phoneme as key and list of % correctly predicted phonemes as value
+  ### <Output variable>: Returns dictionary {phoneme: box_stats} in the same order (None for a phoneme without values)
+  return {key: box_stats(values, whisker = whisker, max_outliers = max_outliers) for key, values in phn_counter_dict.items()}
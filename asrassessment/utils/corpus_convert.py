@@ -0,0 +1,140 @@
+#One time conversion of a TIMIT corpus (NIST SPHERE .wav) into a separate directory of standard .wav files
+
+#global imports
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+#tqdm and scipy are imported in the functions using them, so importing the package stays fast
+
+#local imports
+from .timit_load import TIMIT_file
+from .data_input import read_audio
+
+MANIFEST_NAME = 'conversion_manifest.json'
+MANIFEST_VERSION = 1
+
+def _sha256(file_directory):
+  digest = hashlib.sha256()
+  with open(file_directory, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+def _convert_file(src, dst):
+  #runs in a worker process: convert (.wav) or copy (.phn/.txt/.wrd) one file, returns its manifest entry
+  os.makedirs(os.path.dirname(dst), exist_ok = True)
+  tmp = f"{dst}.{os.getpid()}.tmp"
+  entry = {}
+  if src.lower().endswith('.wav'):
+    import scipy.io.wavfile as wf
+    audio, sample_rate = read_audio(src, mmap = False)
+    wf.write(tmp, sample_rate, audio)
+    entry['samples'] = int(audio.shape[0])
+    entry['sample_rate'] = int(sample_rate)
+  else:
+    shutil.copyfile(src, tmp)
+  os.replace(tmp, dst)
+
+  src_stat = os.stat(src)
+  entry.update({'src_size': src_stat.st_size, 'src_mtime': src_stat.st_mtime_ns,
+                'size': os.path.getsize(dst), 'sha256': _sha256(dst)})
+  return entry
+
+def _is_current(entry, src, dst):
+  #O(1) check (two stat calls) that dst was converted from the current version of src
+  if entry is None:
+    return False
+  try:
+    src_stat = os.stat(src)
+    return (entry['src_size'] == src_stat.st_size and entry['src_mtime'] == src_stat.st_mtime_ns
+            and entry['size'] == os.path.getsize(dst))
+  except OSError:
+    return False
+
+def load_conversion_manifest(output_directory):
+
+  ### <Output variable>: Returns the manifest {'version', 'source', 'files': {relative path: entry}} of a converted corpus,
+  ###                    entry = {'src_size', 'src_mtime', 'size', 'sha256'} (+ 'samples', 'sample_rate' for .wav files)
+  try:
+    with open(os.path.join(output_directory, MANIFEST_NAME)) as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return {'version': MANIFEST_VERSION, 'source': None, 'files': {}}
+  if manifest.get('version') != MANIFEST_VERSION:
+    return {'version': MANIFEST_VERSION, 'source': None, 'files': {}}
+  return manifest
+
+def _save_conversion_manifest(output_directory, manifest):
+  path = os.path.join(output_directory, MANIFEST_NAME)
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, 'w') as f:
+    json.dump(manifest, f, separators = (',', ':'))
+  os.replace(tmp, path)
+
+def convert_corpus(file_directory, output_directory, capital = False, workers = None, chunksize = 16):
+
+  ### <Purpose of function>: Convert every .wav file of a TIMIT corpus to a standard .wav file (samples copied as they are)
+  ###                        and copy the .phn/.txt/.wrd files, into output_directory with the same layout.
+  ###                        The original corpus is never written to. Files converted by a previous run are skipped
+  ###                        as long as their source file is unchanged, so the conversion only costs once.
+  ### <Input variables>:     file_directory   = TIMIT corpus (folder containing the 'test' & 'train' folders)
+  ###                        output_directory = folder for the converted corpus (+ conversion_manifest.json)
+  ###                        capital          = same as TIMIT_file
+  ###                        workers          = number of processes (None = number of CPUs, 1 = in this process)
+  ### <Output variable>:     Returns TIMIT_dict of the converted corpus (see timit_load.TIMIT_file)
+
+  from tqdm import tqdm
+
+  TIMIT_dict = TIMIT_file(file_directory, capital = capital)
+  manifest = load_conversion_manifest(output_directory)
+  manifest['source'] = os.path.abspath(file_directory)
+  files = manifest['files']
+
+  todo = []
+  for DRs in TIMIT_dict.values():
+    for speakers in DRs.values():
+      for speaker_files in speakers.values():
+        for file_lst in speaker_files.values():
+          for src in file_lst:
+            rel = os.path.relpath(src, file_directory)
+            dst = os.path.join(output_directory, rel)
+            if not _is_current(files.get(rel), src, dst):
+              todo.append((rel, src, dst))
+
+  os.makedirs(output_directory, exist_ok = True)
+  try:
+    with tqdm(total = len(todo), desc = "converting") as progress:
+      if workers == 1 or len(todo) <= 1:
+        for rel, src, dst in todo:
+          files[rel] = _convert_file(src, dst)
+          progress.update(1)
+      else:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+          entries = pool.map(_convert_file, [src for rel, src, dst in todo], [dst for rel, src, dst in todo], chunksize = chunksize)
+          for (rel, src, dst), entry in zip(todo, entries):
+            files[rel] = entry
+            progress.update(1)
+  finally:
+    #files converted before an error/interruption are kept for the next run
+    _save_conversion_manifest(output_directory, manifest)
+
+  return TIMIT_file(output_directory, capital = capital)
+
+def verify_corpus(output_directory, checksum = False):
+
+  ### <Purpose of function>: Check a converted corpus against its manifest
+  ### <Input variables>:     checksum = False for the O(1) per file check (file exists with the recorded size),
+  ###                                   True to also recompute the sha256 of every file
+  ### <Output variable>:     Returns list of relative paths of the files which are missing or differ from the manifest
+  bad = []
+  for rel, entry in load_conversion_manifest(output_directory)['files'].items():
+    dst = os.path.join(output_directory, rel)
+    try:
+      ok = os.path.getsize(dst) == entry['size'] and (not checksum or _sha256(dst) == entry['sha256'])
+    except OSError:
+      ok = False
+    if not ok:
+      bad.append(rel)
+  return bad
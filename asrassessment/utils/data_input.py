@@ -27,34 +27,69 @@
 
 
 ## CONVERTING NIST SPHERE .WAV file to 'useable' file
-import librosa
+import os
+import struct
+import hashlib
+import threading
 import numpy as np
-import scipy.io.wavfile as wf
-from sklearn import preprocessing
+#librosa and scipy are imported in the functions using them (only needed to decode/write files)
 
-def load_wav(file_directory):
+#local imports
+from .generalfunc import cache_dir
+
+INT16_RANGE = (-32768, 32767)
+
+def quantize_int16(audio, copy = True):
+
+  ### <Purpose of function>: Min-max scale audio to the int16 range and convert it to int16
+  ###                        (same values as sklearn MinMaxScaler(feature_range=(-32768, 32767)).fit_transform(audio.reshape(-1,1)).astype(np.int16),
+  ###                        without the 2D reshape/copies)
+  ### <Input variables>:     audio = float numpy array (any shape, scaled over all values)
+  ###                        copy = False to scale the float array in place (its values are overwritten)
+  ### <Output variable>:     Returns int16 array of the same shape as audio
+
+  audio = np.asarray(audio)
+  if not np.issubdtype(audio.dtype, np.floating):
+    audio = audio.astype(np.float64)
+  elif copy:
+    audio = audio.copy()
+
+  #computed on 1 element arrays of the audio dtype, as MinMaxScaler does, so rounding is identical
+  flat = audio.reshape(-1, 1)
+  data_min = np.nanmin(flat, axis = 0)
+  data_range = np.nanmax(flat, axis = 0) - data_min
+  data_range[data_range < 10 * np.finfo(data_range.dtype).eps] = 1.0
+  scale = (INT16_RANGE[1] - INT16_RANGE[0]) / data_range
+  offset = INT16_RANGE[0] - data_min * scale
+
+  flat *= scale
+  flat += offset
+  return audio.astype(np.int16)
+
+def load_wav(file_directory, quantize = True):
   ### Function to load wav file as array
+  ### quantize = False to return the float32 samples from librosa (for a next stage using float32)
 
   #load file using librosa
+  import librosa
   audio, sr = librosa.load(file_directory,sr=16000)
+  if not quantize:
+    return audio.reshape(-1,1)
 
-  #scale the values before converting to float
-  minmax_scale = preprocessing.MinMaxScaler(feature_range=(-32768, 32767))
-  x_scale = minmax_scale.fit_transform(audio.reshape(-1,1))
-  x_scale = x_scale.astype(np.int16)
-
-  return x_scale
+  #scale the values before converting to int16
+  return quantize_int16(audio.reshape(-1,1), copy = False)
 
 def convert_wav(file_directory,overwrite = False, print=False):
 
   ### LOAD NIST/SPHERE .wav file using librosa which outputs audio in datapoints (0-1)
-  ### Using MinMaxScaler to convert datapoints to range(-32768-32767) so that values are lost after converting to integers
+  ### Using quantize_int16 (min-max scaling) to convert datapoints to range(-32768-32767) so that values are lost after converting to integers
   ### Using scipy.io.wavfile to write a wav file using the datapoints 
   ### overwrite = True to create new file replacing old one
 
   #load file using librosa & scale the values before converting to float
   x_scale = load_wav(file_directory)
   sr = 16000
+  import scipy.io.wavfile as wf
 
   if overwrite:
     #write/overwrite wav file
@@ -66,3 +101,165 @@ def convert_wav(file_directory,overwrite = False, print=False):
     wf.write(file_directory.split('.')[0] + "_NEW.wav", sr, x_scale)
     if print:
       print(f"{file_directory} file written!")
+
+
+## READING NIST SPHERE / RIFF .WAV files directly into numpy (no librosa, no rewriting of the corpus)
+SPHERE_MAGIC = b'NIST_1A'
+
+def is_sphere(file_directory):
+  ### True if the file is still in NIST SPHERE format (TIMIT as distributed)
+  with open(file_directory, 'rb') as f:
+    return f.read(7) == SPHERE_MAGIC
+
+def read_sphere_header(file_directory):
+  ### Returns dictionary of the NIST SPHERE header fields, plus 'header_size'
+  with open(file_directory, 'rb') as f:
+    if f.readline().strip() != SPHERE_MAGIC:
+      raise ValueError(f"{file_directory} is not a NIST SPHERE file")
+    header_size = int(f.readline())
+    lines = f.read(header_size - f.tell()).decode('ascii', 'replace').splitlines()
+
+  header = {'header_size': header_size}
+  for line in lines:
+    parts = line.split(None, 2)
+    if not parts or parts[0] == 'end_head':
+      break
+    if len(parts) == 3:
+      name, field_type, value = parts
+      header[name] = int(value) if field_type == '-i' else float(value) if field_type == '-r' else value
+  return header
+
+def _read_riff_header(file_directory):
+  #returns (sample_rate, channels, bits per sample, format tag, offset of data, number of data bytes)
+  with open(file_directory, 'rb') as f:
+    riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+      raise ValueError(f"{file_directory} is not a RIFF/WAVE file")
+    fmt = None
+    while True:
+      chunk = f.read(8)
+      if len(chunk) < 8:
+        raise ValueError(f"{file_directory} has no data chunk")
+      chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+      if chunk_id == b'fmt ':
+        fmt = struct.unpack('<HHIIHH', f.read(16))
+        f.seek(chunk_size - 16 + (chunk_size % 2), 1)
+      elif chunk_id == b'data':
+        if fmt is None:
+          raise ValueError(f"{file_directory} has no fmt chunk before its data")
+        format_tag, channels, sample_rate, _, _, bits = fmt
+        return sample_rate, channels, bits, format_tag, f.tell(), chunk_size
+      else:
+        f.seek(chunk_size + (chunk_size % 2), 1)
+
+#where the 16 bit PCM samples of a SPHERE/RIFF file are: (byte order, sample rate, channels, offset, number of values),
+#None for other encodings
+def _pcm16_layout(file_directory):
+  if is_sphere(file_directory):
+    header = read_sphere_header(file_directory)
+    if header.get('sample_n_bytes', 2) != 2 or header.get('sample_coding', 'pcm') != 'pcm':
+      return None
+    channels = header.get('channel_count', 1)
+    offset = header['header_size']
+    count = header.get('sample_count', (os.path.getsize(file_directory) - offset) // (2 * channels)) * channels
+    return '>' if header.get('sample_byte_format') == '10' else '<', header.get('sample_rate', 16000), channels, offset, count
+
+  sample_rate, channels, bits, format_tag, offset, n_bytes = _read_riff_header(file_directory)
+  if format_tag not in (1, 0xFFFE) or bits != 16:
+    return None
+  return '<', sample_rate, channels, offset, n_bytes // 2
+
+def read_audio(file_directory, dtype = 'int16', mmap = True):
+
+  ### <Purpose of function>: Read a NIST SPHERE or RIFF .wav file (16 bit PCM) straight into a numpy array
+  ### <Input variables>:     dtype = 'int16' for the raw samples, 'float32' for samples scaled to [-1, 1)
+  ###                        mmap = True to memory map the samples (int16 only, the file is not read until used)
+  ### <Output variable>:     Returns (audio, sample rate), audio of shape (samples,) or (samples, channels)
+  ###
+  ### Other encodings (i.e. shorten compressed SPHERE, float/24 bit .wav) are decoded with librosa instead.
+
+  if dtype not in ('int16', 'float32'):
+    raise ValueError(f"Unknown dtype '{dtype}', use 'int16' or 'float32'")
+
+  layout = _pcm16_layout(file_directory)
+  if layout is None:
+    import librosa
+    audio, sample_rate = librosa.load(file_directory, sr = None, mono = False, dtype = np.float32)
+    audio = audio.T
+    if dtype == 'int16':
+      audio = np.clip(audio * 32768, -32768, 32767).astype(np.int16)
+    return audio, sample_rate
+  byte_order, sample_rate, channels, offset, count = layout
+
+  if count == 0:
+    audio = np.zeros(0, dtype = np.int16)
+  elif mmap:
+    audio = np.memmap(file_directory, dtype = f"{byte_order}i2", mode = 'r', offset = offset, shape = (count,))
+  else:
+    with open(file_directory, 'rb') as f:
+      f.seek(offset)
+      audio = np.frombuffer(f.read(2 * count), dtype = f"{byte_order}i2")
+  if byte_order == '>':
+    audio = audio.astype(np.int16)
+  if channels > 1:
+    audio = audio.reshape(-1, channels)
+
+  if dtype == 'float32':
+    audio = audio.astype(np.float32) / 32768
+  return audio, sample_rate
+
+def ensure_wav(file_directory, output_directory = None):
+
+  ### <Purpose of function>: Standard .wav file with the samples of file_directory, for models reading a file
+  ###                        (the samples are copied as they are, the source file is never written to)
+  ### <Input variables>:     output_directory = folder for the converted copies (default ~/.cache/asrassessment/wav)
+  ### <Output variable>:     Returns file_directory if it is already a standard .wav file, else the directory of its
+  ###                        converted copy (made once, reused as long as the source file is unchanged)
+  if not is_sphere(file_directory):
+    return file_directory
+
+  #copy named after the source directory, size and mtime, so a modified source gets a new copy
+  stat = os.stat(file_directory)
+  key = hashlib.sha1(f"{os.path.abspath(file_directory)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()[:20]
+  if output_directory is None:
+    output_directory = os.path.join(cache_dir(), 'wav')
+  wav_directory = os.path.join(output_directory, f"{key}_{os.path.basename(file_directory)}")
+  if os.path.exists(wav_directory):
+    return wav_directory
+
+  #write to a temporary file then rename, so a reader (or another worker converting the same file) never sees half a file
+  import scipy.io.wavfile as wf
+  audio, sample_rate = read_audio(file_directory, mmap = False)
+  os.makedirs(output_directory, exist_ok = True)
+  tmp_directory = f"{wav_directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+  wf.write(tmp_directory, sample_rate, audio)
+  os.replace(tmp_directory, wav_directory)
+  return wav_directory
+
+def ensure_wav_files(file_directories, output_directory = None):
+
+  ### <Purpose of function>: One time bulk version of ensure_wav (i.e. before running a model in many processes)
+  ### <Output variable>:     Returns list of the readable .wav file directories, in the same order
+  return [ensure_wav(file_directory, output_directory) for file_directory in file_directories]
+
+def model_input(asr_model, file_directory):
+
+  ### <Purpose of function>: Input given to an ASR model for a .wav file
+  ### <Output variable>:     Returns the samples (numpy, nothing written to disk) for a model marked with
+  ###                        scheduler.audio_input, else a readable .wav file directory (see ensure_wav)
+  dtype = getattr(asr_model, 'audio_dtype', None)
+  if dtype is None:
+    return ensure_wav(file_directory)
+  return read_audio(file_directory, dtype = dtype)[0]
+
+def load_audio(file_directory, sr = 16000):
+
+  ### <Purpose of function>: Decode a .wav file (NIST SPHERE or RIFF) to mono float32 samples at sampling rate sr
+  ###                        (same samples as librosa.load(file_directory, sr=sr), without librosa for 16 bit PCM files)
+  audio, sample_rate = read_audio(file_directory, dtype = 'float32')
+  if audio.ndim > 1:
+    audio = audio.mean(axis = 1)
+  if sample_rate != sr:
+    import librosa
+    audio = librosa.resample(audio, orig_sr = sample_rate, target_sr = sr)
+  return np.asarray(audio, dtype = np.float32)
@@ -1,6 +1,13 @@
 #General functions 
+import os
+
 def split_string(string):
   return string.split("/")
 
 def col_to_string(df,colname):
-  return '/'.join(df[colname].tolist())
\ No newline at end of file
+  return '/'.join(df[colname].tolist())
+
+#directory for the package caches (corpus index, ASR outputs)
+def cache_dir():
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(base, 'asrassessment')
@@ -0,0 +1,106 @@
+#Phone inventory: integer IDs for phonemes so utterances can be passed around as compact arrays
+
+#global imports
+import numpy as np
+from array import array
+
+#local imports
+from .standardizer import comapping, IPA_to_TIMIT_mapping, TIMIT_to_IPA_mapping
+
+class PhoneInventory:
+
+  ### <Purpose of class>: Give every phoneme symbol a stable integer ID (int16), so that an utterance is
+  ###                     split once ("a/b/c" -> array([ID_a, ID_b, ID_c])) and then used as an array by every stage
+  ### <Input variables>:  symbols = initial symbols, default is every phoneme found in comapping,
+  ###                               IPA_to_TIMIT_mapping and TIMIT_to_IPA_mapping (keys and values)
+  ###
+  ### Symbols that are not known yet (i.e. unexpected ASR output) are added when encoded,
+  ### so the IDs of an inventory never change once given out.
+
+  dtype = np.int16
+
+  def __init__(self, symbols = None):
+    if symbols is None:
+      symbols = [phn for group in comapping.values() for phn in group]
+      for mapping in (IPA_to_TIMIT_mapping, TIMIT_to_IPA_mapping):
+        symbols += list(mapping.keys()) + list(mapping.values())
+    self.symbols = []
+    self.ids = {}
+    for symbol in symbols:
+      self.add(symbol)
+    self._tables = {}
+
+  def __len__(self):
+    return len(self.symbols)
+
+  def __contains__(self, symbol):
+    return symbol in self.ids
+
+  def add(self, symbol):
+    ### Returns ID of symbol, adding it to the inventory if needed
+    phn_id = self.ids.get(symbol)
+    if phn_id is None:
+      phn_id = len(self.symbols)
+      if phn_id > np.iinfo(self.dtype).max:
+        raise OverflowError("PhoneInventory is full")
+      self.ids[symbol] = phn_id
+      self.symbols.append(symbol)
+    return phn_id
+
+  def encode(self, utterance, split = True):
+    ### utterance = phoneme string "a/b/c" (or list of phonemes if split = False)
+    ### Returns int16 numpy array of IDs
+    if split:
+      utterance = utterance.split('/')
+    ids = self.ids
+    add = self.add
+    return np.array([ids[phn] if phn in ids else add(phn) for phn in utterance], dtype = self.dtype)
+
+  def encode_list(self, utterances, split = True):
+    ### encode for a whole list of utterances
+    return [self.encode(utt, split = split) for utt in utterances]
+
+  def decode(self, ids):
+    ### Returns list of phoneme symbols
+    symbols = self.symbols
+    return [symbols[phn_id] for phn_id in np.asarray(ids).tolist()]
+
+  def to_string(self, ids):
+    ### Returns '/' joined phoneme string (inverse of encode)
+    return '/'.join(self.decode(ids))
+
+  def to_array(self, ids):
+    ### Returns the IDs as a compact array('H') (i.e. for pickling/storing many utterances)
+    return array('H', np.asarray(ids, dtype = np.uint16).tobytes())
+
+  def _table(self, mapping):
+    #lookup table ID -> mapped ID, rebuilt when the inventory has grown since the last call
+    key = id(mapping)
+    table = self._tables.get(key)
+    if table is None or len(table) != len(self.symbols):
+      table = np.array([self.add(mapping.get(phn, phn)) for phn in list(self.symbols)], dtype = self.dtype)
+      if len(table) != len(self.symbols): #mapping added new symbols, map those too
+        return self._table(mapping)
+      self._tables[key] = table
+    return table
+
+  def IPA_to_TIMIT(self, ids):
+    ### Same as standardizer.IPA_to_TIMIT on an array of IDs
+    return self._table(IPA_to_TIMIT_mapping)[as_ids(ids)]
+
+  def TIMIT_to_IPA(self, ids):
+    ### Same as standardizer.TIMIT_to_IPA on an array of IDs
+    return self._table(TIMIT_to_IPA_mapping)[as_ids(ids)]
+
+#check for utterances given as ID arrays instead of phoneme strings
+def is_ids(utterance):
+  return isinstance(utterance, (np.ndarray, array))
+
+#view an ID array (numpy or array('H')) as a numpy integer array without copying
+def as_ids(utterance):
+  if isinstance(utterance, array):
+    return np.frombuffer(utterance, dtype = np.uint16) if len(utterance) else np.zeros(0, dtype = np.uint16)
+  return np.asarray(utterance)
+
+#default inventory shared by the whole package
+phone_inventory = PhoneInventory()
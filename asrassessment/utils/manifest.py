@@ -0,0 +1,97 @@
+#Columnar manifest of a TIMIT corpus: one row per utterance instead of the nested TIMIT_dict
+
+#global imports
+import os
+import sys
+import numpy as np
+
+#local imports
+from .standardizer import parse_phn
+
+FILE_TYPES = ['wav', 'phn', 'txt', 'wrd']
+
+#Function to flatten TIMIT_dict into a dataframe
+def build_manifest(TIMIT_dict, duration = True, fs = 16000):
+
+  ### <Purpose of function>: Flatten TIMIT_dict (see timit_load.TIMIT_file) into one row per utterance
+  ### <Input variables>:     TIMIT_dict = dictionary from TIMIT_file (capital or not)
+  ###                        duration = True to add the duration (s) of each utterance, taken from the end of its last phoneme
+  ###                                   (nan without .PHN file or for an empty/truncated one)
+  ###                        fs = sampling rate of the .PHN sample numbers
+  ### <Output variable>:     Returns dataframe with columns (set, DR, speaker, utterance, wav, phn, txt, wrd, duration,
+  ###                        DR_index, speaker_index). DR_index/speaker_index are the positions of the DR in its set and of
+  ###                        the speaker in its DR, which select_manifest uses to reproduce the DR = [a,b] / SPK = [a,b] ranges
+
+  import pandas as pd
+
+  columns = {col: [] for col in ['set', 'DR', 'speaker', 'utterance'] + FILE_TYPES + ['DR_index', 'speaker_index']}
+
+  for set_dir, DRs in TIMIT_dict.items():
+    for DR_index, (DR_dir, speakers) in enumerate(DRs.items()):
+      for speaker_index, (speaker_dir, files) in enumerate(speakers.items()):
+
+        #group the files of the speaker by utterance id (file name without extension)
+        utterances = {}
+        for filetype, file_lst in files.items():
+          for file_dir in file_lst:
+            utterance = os.path.basename(file_dir).split('.')[0]
+            utterances.setdefault(utterance, {})[filetype.lower()] = file_dir
+
+        for utterance in sorted(utterances):
+          columns['set'].append(set_dir)
+          columns['DR'].append(DR_dir)
+          columns['speaker'].append(speaker_dir)
+          columns['utterance'].append(utterance)
+          for filetype in FILE_TYPES:
+            columns[filetype].append(utterances[utterance].get(filetype))
+          columns['DR_index'].append(DR_index)
+          columns['speaker_index'].append(speaker_index)
+
+  manifest = pd.DataFrame(columns)
+  if duration:
+    manifest['duration'] = [_phn_duration(phn, fs) for phn in manifest['phn']]
+  return manifest
+
+#duration (s) up to the end of the last phoneme of a .PHN file, nan without .PHN file or for an empty/truncated one
+def _phn_duration(phn, fs):
+  if not phn:
+    return np.nan
+  try:
+    end = parse_phn(phn).end
+  except ValueError:
+    return np.nan
+  return end[-1] / fs if len(end) else np.nan
+
+#Function to select rows of a manifest the same way DR/SPK ranges select keys of TIMIT_dict
+def manifest_mask(manifest, file_set = None, DR = [0,None], SPK = [0,None]):
+
+  ### <Purpose of function>: Boolean mask for a set and the range of DRs (per set) / speakers (per DR)
+  ### <Input variables>:     file_set = "TRAIN" / "TEST" (None for every set)
+  ###                        DR  = range of DR, same meaning as list(TIMIT_dict[file_set].keys())[DR[0]:DR[1]]
+  ###                        SPK = range of speakers within each DR selected
+  ### <Output variable>:     Returns numpy boolean array
+
+  mask = np.ones(len(manifest), dtype = bool)
+  if file_set is not None:
+    mask &= (manifest['set'] == file_set).to_numpy()
+
+  for col, group_cols, rng in [('DR_index', ['set'], DR), ('speaker_index', ['set', 'DR'], SPK)]:
+    if rng is None or list(rng) == [0, None]:
+      continue
+    #number of DRs per set (speakers per DR) to turn negative/None bounds into positions
+    count = manifest.groupby(group_cols, sort = False)[col].transform('max').to_numpy() + 1
+    index = manifest[col].to_numpy()
+    start = np.array([slice(rng[0], rng[1]).indices(n)[0] for n in count], dtype = np.int64)
+    stop = np.array([slice(rng[0], rng[1]).indices(n)[1] for n in count], dtype = np.int64)
+    mask &= (index >= start) & (index < stop)
+  return mask
+
+#Function returning the selected rows of a manifest
+def select_manifest(manifest, file_set = None, DR = [0,None], SPK = [0,None]):
+  return manifest[manifest_mask(manifest, file_set = file_set, DR = DR, SPK = SPK)]
+
+#check for a manifest given to a pipeline in place of TIMIT_dict
+def is_manifest(obj):
+  #without importing pandas: obj can only be a dataframe if pandas was imported already
+  pd = sys.modules.get('pandas')
+  return pd is not None and isinstance(obj, pd.DataFrame)
@@ -0,0 +1,113 @@
+#Noise files decoded once and kept in memory (or memory mapped) to serve noise segments to the noise pipelines
+
+#global imports
+import os
+import glob
+import hashlib
+import numpy as np
+
+#local imports
+from .data_input import load_audio
+from .generalfunc import cache_dir
+from .noise_sidefunc import EPS
+
+class NoiseBank:
+
+  ### <Purpose of class>: Decode every noise file once (resampled to sr, peak normalized) and serve noise segments
+  ###                     of any length from one read only float32 buffer
+  ### <Input variables>:  noise       = noise .wav file, folder of noise files (i.e. noise_dir of noisyspeech.cfg) or list of files
+  ###                     sr          = sampling rate of the noise segments
+  ###                     audioformat = file pattern used for a folder (audioformat of noisyspeech.cfg)
+  ###
+  ### The buffer can be shared with process pool workers: after share(), pickling the bank (i.e. passing it to a worker)
+  ### only sends the .npy file directory and every worker memory maps the same file.
+
+  def __init__(self, noise, sr = 16000, audioformat = '*.wav'):
+    if isinstance(noise, (list, tuple)):
+      files = list(noise)
+    elif os.path.isdir(noise):
+      files = sorted(glob.glob(os.path.join(noise, audioformat)))
+    else:
+      files = [noise]
+    if not files:
+      raise ValueError(f"No noise file found in {noise}")
+
+    noises = []
+    for file_dir in files:
+      audio = load_audio(file_dir, sr = sr)
+      noises.append((audio / (np.abs(audio).max() + EPS)).astype(np.float32))
+    self._set(np.concatenate(noises), [len(audio) for audio in noises], files, sr)
+    self.path = None
+
+  def _set(self, buffer, lengths, files, sr):
+    #read only from the start (not only after share), so scaling a segment in place cannot change the bank
+    buffer.flags.writeable = False
+    self.buffer = buffer
+    self.files = list(files)
+    self.sr = sr
+    self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+  def __len__(self):
+    return len(self.files)
+
+  def noise(self, index = 0):
+    ### Returns the whole (peak normalized) noise of file index, a read only view of the buffer
+    return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+  def segment(self, length, index = 0, offset = 0, loop = True, rng = None):
+
+    ### <Purpose of function>: Noise segment of length samples
+    ### <Input variables>:     index  = noise file ('random' for a random file)
+    ###                        offset = first sample of the segment in the noise ('random' for a random offset)
+    ###                        loop   = True to repeat the noise when it is shorter than length, False to pad with zeros
+    ###                        rng    = numpy Generator for the random choices (default: np.random)
+    ### <Output variable>:     Returns float32 array of length samples (a view of the buffer when no copy is needed)
+    rng = np.random if rng is None else rng
+    if index == 'random':
+      index = int(rng.integers(len(self)) if hasattr(rng, 'integers') else rng.randint(len(self)))
+    noise = self.noise(index)
+    if len(noise) == 0:
+      return np.zeros(length, dtype = np.float32)
+    if offset == 'random':
+      offset = int(rng.integers(len(noise)) if hasattr(rng, 'integers') else rng.randint(len(noise)))
+    offset %= len(noise)
+
+    if offset + length <= len(noise):
+      return noise[offset:offset + length]
+    if loop:
+      return np.take(noise, np.arange(offset, offset + length) % len(noise))
+    segment = np.zeros(length, dtype = np.float32)
+    segment[:len(noise) - offset] = noise[offset:]
+    return segment
+
+  def share(self, path = None):
+
+    ### <Purpose of function>: Move the buffer to a .npy file and memory map it (read only), so workers receiving the
+    ###                        bank map the same file instead of getting a copy
+    ### <Input variables>:     path = .npy file (default ~/.cache/asrassessment/noise_bank_<hash>.npy)
+    ### <Output variable>:     Returns self
+    if path is None:
+      key = hashlib.sha1("|".join(os.path.abspath(file_dir) for file_dir in self.files).encode() + str(self.sr).encode()).hexdigest()[:16]
+      path = os.path.join(cache_dir(), f"noise_bank_{key}.npy")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.asarray(self.buffer))
+    os.replace(tmp_path, path)
+    self.buffer = np.load(path, mmap_mode = 'r')
+    self.path = path
+    return self
+
+  def __reduce__(self):
+    lengths = np.diff(self.offsets).tolist()
+    if self.path is not None:
+      return (_attach_noise_bank, (self.path, lengths, self.files, self.sr))
+    return (_noise_bank_from_buffer, (np.asarray(self.buffer), lengths, self.files, self.sr))
+
+def _noise_bank_from_buffer(buffer, lengths, files, sr, path = None):
+  bank = NoiseBank.__new__(NoiseBank)
+  bank._set(buffer, lengths, files, sr)
+  bank.path = path
+  return bank
+
+def _attach_noise_bank(path, lengths, files, sr):
+  return _noise_bank_from_buffer(np.load(path, mmap_mode = 'r'), lengths, files, sr, path = path)
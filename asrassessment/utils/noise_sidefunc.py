@@ -1,15 +1,13 @@
 import os
 import numpy as np
-import soundfile as sf
 import subprocess
 from glob import glob
-import librosa
 
 EPS = np.finfo(float).eps
 np.random.seed(0)
 
 def is_clipped(audio, clipping_threshold=0.99):
-    return any(abs(audio) > clipping_threshold)
+    return bool(np.any(np.abs(audio) > clipping_threshold))
 
 def normalize(audio, target_level=-25):
     '''Normalize the signal to the target level'''
@@ -31,6 +29,7 @@ def audioread(path, norm=False, start=0, stop=None, target_level=-25):
     path = os.path.abspath(path)
     if not os.path.exists(path):
         raise ValueError("[{}] does not exist!".format(path))
+    import soundfile as sf
     try:
         audio, sample_rate = sf.read(path, start=start, stop=stop)
     except RuntimeError:  # fix for sph pcm-embedded shortened v2
@@ -70,6 +69,7 @@ def audiowrite(destpath, audio, sample_rate=16000, norm=False, target_level=-25,
     if not os.path.exists(destdir):
         os.makedirs(destdir)
 
+    import soundfile as sf
     sf.write(destpath, audio, sample_rate)
     return
 
@@ -158,11 +158,9 @@ def segmental_snr_mixer(params, clean, noise, snr, target_level=-25, clipping_th
 
     # Mix noise and clean speech
     noisyspeech = clean + noisenewlevel
-    print(noisyspeech)
     # Randomly select RMS value between -15 dBFS and -35 dBFS and normalize noisyspeech with that value
     # There is a chance of clipping that might happen with very less probability, which is not a major issue. 
     noisy_rms_level = np.random.randint(params['target_level_lower'], params['target_level_upper'])
-    print
     rmsnoisy = (noisyspeech**2).mean()**0.5
     scalarnoisy = 10 ** (noisy_rms_level / 20) / (rmsnoisy+EPS)
     noisyspeech = noisyspeech * scalarnoisy
@@ -178,24 +176,70 @@ def segmental_snr_mixer(params, clean, noise, snr, target_level=-25, clipping_th
 
     return clean, noisenewlevel, noisyspeech, noisy_rms_level
 
+def segmental_snr_mixer_multi(params, clean, noise, snrs, target_level=-25, clipping_threshold=0.99, generator=False):
+    '''Function to mix clean speech and noise at every segmental SNR level of snrs,
+    same noisy speech as calling segmental_snr_mixer for each level in turn, but the padding, peak normalization
+    and active RMS of clean and noise (which do not depend on the SNR) are only computed once.
+    Returns (noisy speech of shape (len(snrs), samples), noisy_rms_levels), or with generator=True
+    a generator of (noisy speech, noisy_rms_level) for one level at a time'''
+    if len(clean) > len(noise):
+        noise = np.append(noise, np.zeros(len(clean)-len(noise)))
+    else:
+        clean = np.append(clean, np.zeros(len(noise)-len(clean)))
+    clean = clean/(np.abs(clean).max()+EPS)
+    noise = noise/(np.abs(noise).max()+EPS)
+    rmsclean, rmsnoise = active_rms(clean=clean, noise=noise)
+    clean = normalize_segmental_rms(clean, rms=rmsclean, target_level=target_level)
+    noise = normalize_segmental_rms(noise, rms=rmsnoise, target_level=target_level)
+
+    def mix(snr):
+        # Set the noise level for a given SNR and mix noise and clean speech
+        noisescalar = rmsclean / (10**(snr/20)) / (rmsnoise+EPS)
+        noisyspeech = clean + noise * noisescalar
+        # Randomly select RMS value between -15 dBFS and -35 dBFS (one draw per level, in order)
+        noisy_rms_level = np.random.randint(params['target_level_lower'], params['target_level_upper'])
+        rmsnoisy = (noisyspeech**2).mean()**0.5
+        scalarnoisy = 10 ** (noisy_rms_level / 20) / (rmsnoisy+EPS)
+        noisyspeech *= scalarnoisy
+        if is_clipped(noisyspeech):
+            noisyspeech_maxamplevel = np.abs(noisyspeech).max()/(clipping_threshold-EPS)
+            noisyspeech /= noisyspeech_maxamplevel
+            noisy_rms_level = int(20*np.log10(scalarnoisy/noisyspeech_maxamplevel*(rmsnoisy+EPS)))
+        return noisyspeech, noisy_rms_level
+
+    if generator:
+        return (mix(snr) for snr in snrs)
+
+    noisyspeech = np.empty((len(snrs), len(clean)), dtype=np.result_type(clean, noise))
+    noisy_rms_levels = []
+    for i, snr in enumerate(snrs):
+        noisyspeech[i], noisy_rms_level = mix(snr)
+        noisy_rms_levels.append(noisy_rms_level)
+    return noisyspeech, noisy_rms_levels
+
+def _frame_sums(audio, window_samples):
+    '''Sum of squares and number of samples of every window_samples frame (last frame can be shorter)'''
+    n_full = len(audio) // window_samples
+    squares = audio ** 2
+    sums = squares[:n_full*window_samples].reshape(n_full, window_samples).sum(axis=1)
+    lengths = np.full(n_full, window_samples)
+    if n_full*window_samples < len(audio):
+        sums = np.append(sums, squares[n_full*window_samples:].sum())
+        lengths = np.append(lengths, len(audio) - n_full*window_samples)
+    return sums, lengths
+
 def active_rms(clean, noise, fs=16000, energy_thresh=-50):
     '''Returns the clean and noise RMS of the noise calculated only in the active portions'''
     window_size = 100 # in ms
     window_samples = int(fs*window_size/1000)
-    sample_start = 0
-    noise_active_segs = []
-    clean_active_segs = []
-
-    while sample_start < len(noise):
-        sample_end = min(sample_start + window_samples, len(noise))
-        noise_win = noise[sample_start:sample_end]
-        clean_win = clean[sample_start:sample_end]
-        noise_seg_rms = 20*np.log10((noise_win**2).mean()+EPS)
-        # Considering frames with energy
-        if noise_seg_rms > energy_thresh:
-            noise_active_segs = np.append(noise_active_segs, noise_win)
-            clean_active_segs = np.append(clean_active_segs, clean_win)
-        sample_start += window_samples
+
+    # Considering frames with energy
+    sums, lengths = _frame_sums(noise, window_samples)
+    noise_seg_rms = 20*np.log10(sums/np.maximum(lengths, 1)+EPS)
+    active = np.repeat(noise_seg_rms > energy_thresh, lengths)
+
+    noise_active_segs = np.asarray(noise, dtype=float)[active]
+    clean_active_segs = np.asarray(clean[:len(noise)], dtype=float)[active[:len(clean)]]
 
     if len(noise_active_segs)!=0:
         noise_rms = (noise_active_segs**2).mean()**0.5
@@ -215,38 +259,29 @@ def activitydetector(audio, fs=16000, energy_thresh=0.13, target_level=-25):
     audio = normalize(audio, target_level)
     window_size = 50 # in ms
     window_samples = int(fs*window_size/1000)
-    sample_start = 0
-    cnt = 0
-    prev_energy_prob = 0
-    active_frames = 0
 
     a = -1
     b = 0.2
     alpha_rel = 0.05
     alpha_att = 0.8
 
-    while sample_start < len(audio):
-        sample_end = min(sample_start + window_samples, len(audio))
-        audio_win = audio[sample_start:sample_end]
-        frame_rms = 20*np.log10(sum(audio_win**2)+EPS)
-        frame_energy_prob = 1./(1+np.exp(-(a+b*frame_rms)))
-
-        if frame_energy_prob > prev_energy_prob:
-            smoothed_energy_prob = frame_energy_prob*alpha_att + prev_energy_prob*(1-alpha_att)
-        else:
-            smoothed_energy_prob = frame_energy_prob*alpha_rel + prev_energy_prob*(1-alpha_rel)
+    sums, lengths = _frame_sums(audio, window_samples)
+    frame_rms = 20*np.log10(sums+EPS)
+    frame_energy_prob = 1./(1+np.exp(-(a+b*frame_rms)))
 
-        if smoothed_energy_prob > energy_thresh:
-            active_frames += 1
-        prev_energy_prob = frame_energy_prob
-        sample_start += window_samples
-        cnt += 1
+    # smoothing uses the (unsmoothed) probability of the previous frame, so every frame is computed at once
+    prev_energy_prob = np.append(0, frame_energy_prob[:-1])
+    alpha = np.where(frame_energy_prob > prev_energy_prob, alpha_att, alpha_rel)
+    smoothed_energy_prob = frame_energy_prob*alpha + prev_energy_prob*(1-alpha)
 
+    active_frames = int(np.count_nonzero(smoothed_energy_prob > energy_thresh))
+    cnt = len(frame_energy_prob)
     perc_active = active_frames/cnt
     return perc_active
 
 def resampler(input_dir, target_sr=16000, ext='*.wav'):
     '''Resamples the audio files in input_dir to target_sr'''
+    import librosa
     files = glob.glob(f"{input_dir}/"+ext)
     for pathname in files:
         print(pathname)
@@ -1,45 +1,160 @@
 
 #global imports 
-import pandas as pd
+#(pandas, tqdm, scipy and pydub are imported in the functions using them, so error_rate only needs numpy)
 import numpy as np
 import os
+import tempfile
+from contextlib import nullcontext
 
 import difflib
-from tqdm import tqdm
-import copy
-
-import librosa
-from sklearn import preprocessing
-import scipy.io.wavfile as wf
-from pydub import AudioSegment
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 #local imports 
-from .data_input import convert_wav
-from .standardizer import read_phn,TIMIT_to_IPA, IPA_to_TIMIT,file_text
-from .noise_sidefunc import load_params,segmental_snr_mixer
+from .data_input import model_input, quantize_int16, load_audio
+from .standardizer import read_phn,TIMIT_to_IPA, IPA_to_TIMIT,TIMIT_to_IPA_list,IPA_to_TIMIT_list,file_text
+from .noise_sidefunc import load_params,segmental_snr_mixer,segmental_snr_mixer_multi
+from .noise_bank import NoiseBank
+from .phoneme_accuracy import PhonemeAccuracyAccumulator
+from .inventory import phone_inventory, is_ids, as_ids
+from .manifest import is_manifest, select_manifest
+from .asr_cache import require_model_id
+from .scheduler import run_model, call_model, call_batch, takes_audio, estimate_duration
+from .alignment import OP_OK, OP_SUB, OP_INS, OP_DEL, encode_tokens, levenshtein_backtrace, count_ops, score_chunk, Alignment
 
 
 #Function to give a overview of the phoneme error rate 
-def error_rate(timit, asr,phn = True):
-  if phn:
+def error_rate(timit, asr,phn = True, engine = "python", tracker = "df", inventory = phone_inventory):
+
+  ### timit/asr = phoneme strings ("a/b/c"), word strings (phn = False)
+  ###             or phoneme ID arrays (numpy / array('H')) encoded with inventory (see utils/inventory.py),
+  ###             an ID array can be paired with a phoneme string (not with word strings)
+  ### engine  = "python" (default) fills the cost/backtrace matrices cell by cell
+  ###           "numpy" interns the tokens as integer IDs and computes the DP a row at a time (see utils/alignment.py)
+  ###           both give the same counts and tracker
+  ### tracker = "df" (default) returns (counts, tracker_df)
+  ###           "alignment" returns (counts, Alignment), call Alignment.to_df() to get the tracker_df when needed
+  ###           None returns counts only, without building any tracker
+
+  #phoneme ID arrays, a phoneme string paired with an ID array is encoded with the same inventory
+  encoded = is_ids(timit) or is_ids(asr)
+  if encoded and not phn:
+    raise TypeError("phoneme ID arrays can only be scored with phn = True (with ID arrays or phoneme strings), "
+                    "word scoring (phn = False) takes two word strings")
+  if encoded:
+    r_ids = as_ids(timit) if is_ids(timit) else inventory.encode(timit)
+    h_ids = as_ids(asr) if is_ids(asr) else inventory.encode(asr)
+    r, h = r_ids.tolist(), h_ids.tolist()
+  elif phn:
     r = timit.split('/')
     h = asr.split('/')
   else:
     r = timit.split()
     h = asr.split()
 
+  if engine == "numpy":
+    if not encoded:
+      (r_ids, h_ids), _ = encode_tokens(r, h)
+    backtrace = levenshtein_backtrace(r_ids, h_ids)
+  elif engine == "python":
+    backtrace = _python_backtrace(r, h)
+  else:
+    raise ValueError(f"Unknown engine '{engine}', use 'python' or 'numpy'")
+
+  # back trace though the best route:
+  if tracker is None:
+    alignment = None
+    numCor, numSub, numIns, numDel = count_ops(backtrace, len(r), len(h))
+  elif tracker in ("df", "alignment"):
+    if encoded:
+      r, h = inventory.decode(r_ids), inventory.decode(h_ids)
+    alignment = Alignment.from_backtrace(backtrace, r, h)
+    numCor, numSub, numIns, numDel = alignment.counts()
+  else:
+    raise ValueError(f"Unknown tracker '{tracker}', use 'df', 'alignment' or None")
+
+  per_result = round( (numSub + numDel + numIns) / (float) (len(r)), 3)
+  counts = {'PER':per_result, 'Correct':numCor, 'Substitution':numSub, 'Insertion':numIns, 'Deletion':numDel}
+
+  if tracker is None:
+    return counts
+  if tracker == "alignment":
+    return counts, alignment
+  #df to track where an error was made
+  return counts, alignment.to_df()
+
+#Function to score many reference/hypothesis pairs at once
+def error_rate_batch(refs, hyps, phn = True, processes = None, chunksize = 64, inventory = phone_inventory):
+
+  ### <Purpose of function>: Same counts as error_rate for every pair, plus corpus level totals
+  ### <Input variables>:     refs/hyps = lists of TIMIT/ASR strings or phoneme ID arrays (same format as error_rate)
+  ###                        phn = True for phoneme strings ("a/b/c"), False for word strings
+  ###                        processes = number of worker processes (None = os.cpu_count(), 1 = no pool)
+  ###                        chunksize = number of pairs sent to a worker at a time
+  ### <Output variable>:     Returns dictionary of corpus totals (PER over all reference tokens)
+  ###                        and dataframe with one row per pair (PER, Correct, Substitution, Insertion, Deletion, Length),
+  ###                        PER is NaN for an empty reference (its insertions still count in the totals)
+
+  import pandas as pd
+
+  if len(refs) != len(hyps):
+    raise ValueError(f"refs and hyps have different lengths ({len(refs)} and {len(hyps)})")
+
+  #intern tokens once for the whole batch (phonemes with the phone inventory, words with a vocabulary of the batch)
+  vocab = {}
+  pairs = []
+  for timit, asr in zip(refs, hyps):
+    if phn:
+      r = as_ids(timit) if is_ids(timit) else inventory.encode(timit)
+      h = as_ids(asr) if is_ids(asr) else inventory.encode(asr)
+      pairs.append((r, h))
+    elif is_ids(timit) or is_ids(asr):
+      raise TypeError("phoneme ID arrays can only be scored with phn = True, word scoring takes word strings")
+    else:
+      ids, vocab = encode_tokens(timit.split(), asr.split(), vocab = vocab)
+      pairs.append(tuple(ids))
+
+  chunks = [pairs[k:k+chunksize] for k in range(0, len(pairs), chunksize)]
+  if processes is None:
+    processes = os.cpu_count() or 1
+  processes = min(processes, len(chunks))
+
+  if processes > 1:
+    with ProcessPoolExecutor(max_workers = processes) as pool:
+      results = list(pool.map(score_chunk, chunks))
+  else:
+    results = [score_chunk(chunk) for chunk in chunks]
+  counts = np.concatenate(results) if results else np.zeros((0, 4), dtype = np.int64)
+
+  lengths = np.array([len(r) for r, h in pairs], dtype = np.int64)
+  errors = counts[:, OP_SUB] + counts[:, OP_INS] + counts[:, OP_DEL]
+
+  per_utterance_df = pd.DataFrame({'PER': [round(e / float(l), 3) if l else float('nan')
+                                           for e, l in zip(errors.tolist(), lengths.tolist())],
+                                   'Correct': counts[:, OP_OK],
+                                   'Substitution': counts[:, OP_SUB],
+                                   'Insertion': counts[:, OP_INS],
+                                   'Deletion': counts[:, OP_DEL],
+                                   'Length': lengths})
+
+  totals = {'PER': round(float(errors.sum()) / max(int(lengths.sum()), 1), 3),
+            'Correct': int(counts[:, OP_OK].sum()),
+            'Substitution': int(counts[:, OP_SUB].sum()),
+            'Insertion': int(counts[:, OP_INS].sum()),
+            'Deletion': int(counts[:, OP_DEL].sum()),
+            'Length': int(lengths.sum()),
+            'Utterances': len(pairs)}
+  return totals, per_utterance_df
+
+#Pure python Levenshtein DP used by error_rate (engine = "python")
+def _python_backtrace(r, h):
   #costs will holds the costs, like in the Levenshtein distance algorithm
   costs = [[0 for inner in range(len(h)+1)] for outer in range(len(r)+1)]
 
   # backtrace will hold the operations we've done.
   # so we could later backtrace, like the WER algorithm requires us to.
   backtrace = [[0 for inner in range(len(h)+1)] for outer in range(len(r)+1)]
-  
 
-  OP_OK = 0
-  OP_SUB = 1
-  OP_INS = 2
-  OP_DEL = 3
   # First column represents the case where we achieve zero
   # hypothesis words by deleting all reference words.
   for i in range(1, len(r)+1):
@@ -70,59 +185,45 @@ def error_rate(timit, asr,phn = True):
           backtrace[i][j] = OP_INS
         else:
           backtrace[i][j] = OP_DEL
+  return backtrace
 
-  # back trace though the best route:
-  i = len(r)
-  j = len(h)
-  numSub = 0
-  numDel = 0
-  numIns = 0
-  numCor = 0
-
-  #new df to track where an error was made
-  tracker_df = pd.DataFrame({'phoneme':r,'error':['NIL' for i in range(len(r))],'substituted':['NIL' for i in range(len(r))]})
-  
-  while i > 0 or j > 0:
-    if backtrace[i][j] == OP_OK:
-      numCor += 1
-      i-=1
-      j-=1
-    elif backtrace[i][j] == OP_SUB:
-      # edit df
-      tracker_df.at[i-1,"error"] = "Substitution"
-      tracker_df.at[i-1,'substituted'] = h[j-1]
-      # print(f"There was a substitution of {h[j-1]} for {r[i-1]} between {r[i-2]} and {r[i]}.")
-      numSub +=1
-      i-=1
-      j-=1
-    elif backtrace[i][j] == OP_INS:
-      numIns += 1
-      # try:
-      #   print(f"There was an insertion of {h[j-1]} between {r[i-1]} and {r[i]}.")
-      # except: 
-      #   print(f"There was an insertion of {h[j-1]} after {r[i-1]}")
-      j-=1
-    elif backtrace[i][j] == OP_DEL:
-      numDel += 1
-      # edit df
-      tracker_df.at[i-1,"error"] = "Deletion"
-      # try:
-      #   print(f"There was a deletion     of {r[i-1]} between {r[i-2]} and {r[i]}.")
-      # except:
-      #   print(f"There was a deletion     of {r[i-1]} after {r[i-2]}")
-      i-=1
-  per_result = round( (numSub + numDel + numIns) / (float) (len(r)), 3)
-  return {'PER':per_result, 'Correct':numCor, 'Substitution':numSub, 'Insertion':numIns, 'Deletion':numDel}, tracker_df
+#Function to align one utterance once and get both the error counts and the per phoneme counts
+def score_utterance(TIMIT_phoneme, ASR_phoneme, engine = "numpy"):
+
+  ### <Purpose of function>: Single alignment pass giving the output of error_rate (counts) and sequence_match
+  ### <Input variables>:     TIMIT_phoneme and ASR_phoneme (strings or phoneme ID arrays), Example:"a/d/b/a/e"
+  ###                        engine = "numpy" / "python", see error_rate
+  ### <Output variable>:     Returns (counts dictionary as error_rate, phoneme dictionary as sequence_match)
+
+  counts, alignment = error_rate(TIMIT_phoneme, ASR_phoneme, engine = engine, tracker = "alignment")
+  phoneme_counter_dict = alignment.phoneme_counts()
+
+  #Remove unwanted strings '' and '/'
+  phoneme_counter_dict.pop('', None)
+  phoneme_counter_dict.pop('/', None)
+
+  return counts, phoneme_counter_dict
 
 #Function to give exact number of times wrongly and correctly predicted phonemes  
-def sequence_match(TIMIT_phoneme, ASR_phoneme):
+def sequence_match(TIMIT_phoneme, ASR_phoneme, legacy = False):
 
   ### <Purpose of function>: To get number of correctly and wrongly predicted phonemes according to each phoneme 
-  ### <Input variables>:     TIMIT_phoneme and ASR_phoneme (strings), Example:"a/d/b/a/e"
+  ### <Input variables>:     TIMIT_phoneme and ASR_phoneme (strings or phoneme ID arrays), Example:"a/d/b/a/e"
+  ###                        legacy = False uses the same Levenshtein alignment as error_rate (see score_utterance)
+  ###                                 True uses difflib.SequenceMatcher (behaviour of versions <= 0.2.1)
   ### <Output variable>:     Returns Dictionary with phoneme as key and list containing [num of correct, num of wrong] as value
 
-  timit = TIMIT_phoneme.split("/")
-  asr = ASR_phoneme.split("/")
+  if not legacy:
+    return score_utterance(TIMIT_phoneme, ASR_phoneme)[1]
+
+  if is_ids(TIMIT_phoneme):
+    timit = phone_inventory.decode(TIMIT_phoneme)
+  else:
+    timit = TIMIT_phoneme.split("/")
+  if is_ids(ASR_phoneme):
+    asr = phone_inventory.decode(ASR_phoneme)
+  else:
+    asr = ASR_phoneme.split("/")
   
   #initiate sequence matcher
   seq_matcher = difflib.SequenceMatcher(None,timit,asr) 
@@ -161,47 +262,104 @@ def sequence_match(TIMIT_phoneme, ASR_phoneme):
   return phoneme_counter_dict
 
 #Using ASR model, convert .wav file into phn and iteratively replace the phn file of asr_dict
-def load_asr_dict(TIMIT_dict,asr_model, file_set = "TRAIN",DR = [0,None],noise_file = False):
+def load_asr_dict(TIMIT_dict,asr_model, file_set = "TRAIN",DR = [0,None],noise_file = False, cache = None, model_id = None,
+                  workers = 1, backend = "thread", model_factory = None):
   ### <Purpose of function>: Using ASR model, convert .wav file into phn and iteratively replace the phn file of asr_dict
   ### <Input variables>:     TIMIT_dict = prior to this function, load the timit_file into a dictionary using the timit_load function in timit_load.py
+  ###                                     (or a manifest from manifest.build_manifest)
   ###                        asr_model = function of ASR model, 
   ###                        file_set = "TRAIN" / "TEST"
   ###                        DR = choose the range of DR files want to use for TESTING/TRAINING
+  ###                        cache = optional ASRCache (asr_cache.py), .wav files already run with the same model_id are not run again
+  ###                        model_id = identifier of the model (and its settings) for the cache, required with cache
+  ###                        workers/backend/model_factory = run the model in parallel, see scheduler.run_model
+  ###                        Models marked with scheduler.batched get lists of .wav files (batches of max_batch_size files /
+  ###                        max_batch_duration seconds) instead of one file per call
   ### <Output variable>:     Returns dictionary containing list of phoneme in same manner as in TIMIT_dict, just without
   ###                        .wav, .txt, .wrd files
-  
-  #create deepcopy of dictionary
-  asr_dict = copy.deepcopy(TIMIT_dict)
-  for DR in list(asr_dict[file_set].keys())[DR[0]:DR[1]]:
-    for speaker in tqdm(asr_dict[file_set][DR].keys()):
-      timit_wav_list = asr_dict[file_set][DR][speaker]["wav"]
-
-      ASR_phoneme_lst = []
-      for file_dir in timit_wav_list:
-        convert_wav(file_dir,overwrite = True)
-        ASR_phoneme = asr_model(file_dir) ### insert model function here
-        ASR_phoneme_lst.append(ASR_phoneme)
-      
-      #replace file_dir with phonemes
-      asr_dict[file_set][DR][speaker]["phn"] = ASR_phoneme_lst
-
-      #remove unnecessary file types
-      file_types = ['txt', 'wrd', 'wav']
-      for file_type in file_types:
-        asr_dict[file_set][DR][speaker].pop(file_type)
+  ###                        For a manifest, returns the selected rows with the ASR output added as column 'asr'
+  ###                        A file for which the model raised an error gets None as output, and the error is kept in
+  ###                        asr_dict[file_set][DR][speaker]['failed'] ({file directory: scheduler.TaskFailure}) / column 'asr_error'
+  ###                        of the manifest (a warning gives the number of failed files, RuntimeError if every file failed)
+
+  if cache is not None:
+    require_model_id(model_id)
+  task = partial(_run_asr, cache = cache, model_id = model_id)
+  batch_task = partial(_run_asr_batch, cache = cache, model_id = model_id)
+
+  if is_manifest(TIMIT_dict):
+    asr_manifest = select_manifest(TIMIT_dict, file_set = file_set, DR = DR)
+    #duration of the .PHN file, estimated from the .wav file size where it is nan (no/empty .PHN file)
+    durations = None
+    if 'duration' in asr_manifest:
+      durations = [estimate_duration(file_dir) if np.isnan(duration) else duration
+                   for file_dir, duration in zip(asr_manifest['wav'], asr_manifest['duration'])]
+    ASR_phoneme_lst, failures = run_model(task, asr_manifest['wav'].tolist(), asr_model = asr_model, model_factory = model_factory,
+                                          workers = workers, backend = backend, batch_task = batch_task, durations = durations)
+    errors = [failures.get(i) for i in range(len(ASR_phoneme_lst))]
+    return asr_manifest.assign(asr = ASR_phoneme_lst, asr_error = errors)
+
+  #copy of the dictionary structure (the lists of file directories are shared, not copied)
+  asr_dict = {set_dir: {DR_dir: {speaker: dict(files) for speaker, files in speakers.items()}
+                        for DR_dir, speakers in DRs.items()}
+              for set_dir, DRs in TIMIT_dict.items()}
+
+  #every selected .wav file, scheduled in one go
+  speakers = [(DR, speaker) for DR in list(asr_dict[file_set].keys())[DR[0]:DR[1]] for speaker in asr_dict[file_set][DR].keys()]
+  timit_wav_list = [file_dir for DR, speaker in speakers for file_dir in asr_dict[file_set][DR][speaker]["wav"]]
+  ASR_phoneme_lst, failures = run_model(task, timit_wav_list, asr_model = asr_model, model_factory = model_factory,
+                                        workers = workers, backend = backend, batch_task = batch_task)
+
+  index = 0
+  for DR, speaker in speakers:
+    speaker_dict = asr_dict[file_set][DR][speaker]
+    n_files = len(speaker_dict["wav"])
+
+    #replace file_dir with phonemes
+    speaker_dict["phn"] = ASR_phoneme_lst[index:index + n_files]
+    failed = {timit_wav_list[i]: failures[i] for i in range(index, index + n_files) if i in failures}
+    if failed:
+      speaker_dict["failed"] = failed
+    index += n_files
+
+    #remove unnecessary file types
+    file_types = ['txt', 'wrd', 'wav']
+    for file_type in file_types:
+      speaker_dict.pop(file_type)
       
   return asr_dict
 
+#run the ASR model on a .wav file (as audio or as a readable .wav, see data_input.model_input), unless the output is already in the cache
+def _run_asr(asr_model, file_dir, cache = None, model_id = None):
+  audio = model_input(asr_model, file_dir)
+  if cache is None:
+    return asr_model(audio)
+  return cache.run(asr_model, [audio], require_model_id(model_id))[0]
+
+#same as _run_asr for a list of .wav files, calling a batch model once for every file not in the cache
+def _run_asr_batch(asr_model, file_dirs, cache = None, model_id = None):
+  audios = [model_input(asr_model, file_dir) for file_dir in file_dirs]
+  if cache is None:
+    return call_batch(asr_model, audios)
+  return cache.run(asr_model, audios, require_model_id(model_id), batch = True)
+
 #To compare the phoneme strings of TEST/TRAIN set of TIMIT and output a list of datapoints       
-def compare_phonemes_perc(TIMIT_dict,asr_dict,file_set = "TRAIN",DR = [0,None]):
+def compare_phonemes_perc(TIMIT_dict,asr_dict,file_set = "TRAIN",DR = [0,None],legacy = False,accumulator = None):
 
   ### <Purpose of function>: To compare the phoneme strings of TEST/TRAIN set of TIMIT and output a list of datapoints 
   ###                        (percentage correct for each recording) of each phoneme.
   ### <Input Variables>:     
   ###                        TIMIT_dict = prior to this function, load the timit_file into a dictionary using the timit_load function in timit_load.py
   ###                        asr_dict = dictionary containing phonemes output from ASR model with the same directory as TIMIT
+  ###                                   (or the manifest returned by load_asr_dict when TIMIT_dict is a manifest)
   ###                        file_set = "TEST" or "TRAIN"
+  ###                        legacy = True to align with difflib instead of the Levenshtein alignment (see sequence_match)
+  ###                        accumulator = True (new) or a PhonemeAccuracyAccumulator to update instead of building lists,
+  ###                                      i.e. to run DR ranges/file sets in different processes and merge the results
   ### <Output>:              Returns Dictionary containing phoneme as key and list of % correctly predicted phonemes as value.
+  ###                        (the PhonemeAccuracyAccumulator when accumulator is given)
+
+  from tqdm import tqdm
 
   ##compare asr vs timit phonemes 
   phn_counter_dict = {
@@ -233,6 +391,21 @@ def compare_phonemes_perc(TIMIT_dict,asr_dict,file_set = "TRAIN",DR = [0,None]):
               "ih":[],"ux":[],"er":[],"ix":[],"axr":[],"ax-h":[],"dx":[],"en":[],"em":[],"y":[],"hh":[],"el":[],"eng":[],"hv":[]
   }
 
+  #fixed size statistics instead of lists (same phoneme order)
+  if accumulator is not None:
+    if accumulator is True:
+      accumulator = PhonemeAccuracyAccumulator()
+    accumulator.add_phonemes(phn_counter_dict)
+    phn_counter_dict = accumulator
+
+  if is_manifest(TIMIT_dict):
+    rows = select_manifest(TIMIT_dict, file_set = file_set, DR = DR)
+    asr_phn = asr_dict['asr'].reindex(rows.index)
+    rows = rows[asr_phn.notna().to_numpy()]
+    TIMIT_phoneme_lst = [read_phn(filename = file_dir,string = True) for file_dir in tqdm(rows['phn'].tolist())]
+    _add_phoneme_percentages(phn_counter_dict, TIMIT_phoneme_lst, asr_phn.dropna().tolist(), legacy = legacy)
+    return phn_counter_dict
+
   #setting train or test set
   for DR_index in list(TIMIT_dict[file_set].keys())[DR[0]:DR[1]]:
     for speaker in tqdm(TIMIT_dict[file_set][DR_index].keys()):
@@ -248,54 +421,60 @@ def compare_phonemes_perc(TIMIT_dict,asr_dict,file_set = "TRAIN",DR = [0,None]):
         TIMIT_phoneme = read_phn(filename = file_dir,string = True)
         TIMIT_phoneme_lst.append(TIMIT_phoneme)
 
-      #get phoneme from ASR model
-      asr_phn_dir_list = sorted(asr_dict[file_set][DR_index][speaker]['phn'])
+      #get phoneme from ASR model (same order as the sorted .wav files used by load_asr_dict)
+      asr_phn_dir_list = asr_dict[file_set][DR_index][speaker]['phn']
 
-      #convert to standardized phoneme
-      TIMIT_phoneme_lst_c = []
-      for phn in TIMIT_phoneme_lst:
-        timit_phn = TIMIT_to_IPA(phn)
-        TIMIT_phoneme_lst_c.append(timit_phn)
+      if len(TIMIT_phoneme_lst) == len(asr_phn_dir_list):
+        _add_phoneme_percentages(phn_counter_dict, TIMIT_phoneme_lst, asr_phn_dir_list, legacy = legacy)
 
-      ASR_phoneme_lst_c = []
-      for phn in asr_phn_dir_list:
-        asr_phn = IPA_to_TIMIT(phn)
-        ASR_phoneme_lst_c.append(asr_phn)
+  return phn_counter_dict
 
-      if len(TIMIT_phoneme_lst_c) == len(ASR_phoneme_lst_c):
-        for i in range(len(TIMIT_phoneme_lst_c)):
-          x = sequence_match(TIMIT_phoneme_lst_c[i],ASR_phoneme_lst_c[i])
-          
-          for key in x.keys():
-            percentage_correct = x[key][0]/(x[key][0]+x[key][1])*100
 
-            if key in phn_counter_dict:
-              phn_counter_dict[key].append(percentage_correct)
-            else:
-              phn_counter_dict[key] = [percentage_correct]
 
-  return phn_counter_dict
+#add the % of correctly predicted phonemes of each utterance to phn_counter_dict (dictionary of lists or PhonemeAccuracyAccumulator)
+def _add_phoneme_percentages(phn_counter_dict, TIMIT_phoneme_lst, asr_phn_lst, legacy = False):
 
+  #skip files the ASR model failed on (see load_asr_dict)
+  if None in asr_phn_lst:
+    kept = [i for i, phn in enumerate(asr_phn_lst) if phn is not None]
+    TIMIT_phoneme_lst = [TIMIT_phoneme_lst[i] for i in kept]
+    asr_phn_lst = [asr_phn_lst[i] for i in kept]
 
+  #convert to standardized phoneme (as phoneme ID arrays, only split once)
+  if legacy:
+    TIMIT_phoneme_lst_c = TIMIT_to_IPA_list(TIMIT_phoneme_lst)
+    ASR_phoneme_lst_c = IPA_to_TIMIT_list(asr_phn_lst)
+  else:
+    TIMIT_phoneme_lst_c = [phone_inventory.TIMIT_to_IPA(ids) for ids in phone_inventory.encode_list(TIMIT_phoneme_lst)]
+    ASR_phoneme_lst_c = [phone_inventory.IPA_to_TIMIT(ids) for ids in phone_inventory.encode_list(asr_phn_lst)]
 
-#ADD NOISE
-def add_noise(audio_dir,noise_dir, cfg_filedir,louder=0,softer=0):
-      ### <Purpose of Function>: Add noise (optional varying volumes) to audio
-  ### <Variable>           : audio_dir = timit.wav file
-  ###                        noise_dir = noise.wav file 
-  ###                        cfg_filedir = cfg file used for setting params
-  ###                        louder = integer input to increase volume of noise
-  ### <Output>             : new audio file with noise exported same file directory as audio_dir with new label         
+  for i in range(len(TIMIT_phoneme_lst_c)):
+    x = sequence_match(TIMIT_phoneme_lst_c[i],ASR_phoneme_lst_c[i],legacy=legacy)
 
-  #Load params
-  params = load_params(cfg_filedir)
+    if isinstance(phn_counter_dict, PhonemeAccuracyAccumulator):
+      phn_counter_dict.update(x)
+      continue
+
+    for key in x.keys():
+      percentage_correct = x[key][0]/(x[key][0]+x[key][1])*100
+
+      if key in phn_counter_dict:
+        phn_counter_dict[key].append(percentage_correct)
+      else:
+        phn_counter_dict[key] = [percentage_correct]
 
+#columns of the noise comparison dataframes
+NOISE_COLUMNS = ["Volume", "Error Rate (%)", "Type of Error"]
 
-  #Load audio and noise
-  clean = librosa.load(audio_dir,16000)
-  clean = clean[0]
-  noise = librosa.load(noise_dir,16000)
-  noise = noise[0]
+#ADD NOISE
+def noisy_audio(clean, noise, params, louder=0, softer=0, quantize=True):
+  ### <Purpose of Function>: Add noise (optional varying volumes) to audio, in memory
+  ### <Variable>           : clean = float samples of the timit.wav file (16 kHz, see data_input.load_audio)
+  ###                        noise = float samples of the noise.wav file (16 kHz)
+  ###                        params = params from load_params (cfg file)
+  ###                        louder/softer = integer input to increase/decrease volume of noise
+  ###                        quantize = False to return the float32 samples (no int16 min-max scaling)
+  ### <Output>             : noisy audio as numpy array (int16, same samples add_noise writes, or float32)
 
   ##Mix noisy audio with clean audio
   clean, noisenewlevel, noisyspeech, noisy_rms_level = segmental_snr_mixer(params = params, 
@@ -303,22 +482,66 @@ def add_noise(audio_dir,noise_dir, cfg_filedir,louder=0,softer=0):
                                                                           noise = noise,
                                                                           snr = softer-louder)
   
-  ##Scale the values before converting to float
-  minmax_scale = preprocessing.MinMaxScaler(feature_range=(-32768, 32767))
+  ##Scale the values before converting to int16
+  if quantize:
+    return quantize_int16(noisyspeech, copy = False)
+  return noisyspeech.astype(np.float32)
+
+def noisy_audio_levels(clean, noise, params, snrs, quantize=True):
+  ### <Purpose of Function>: noisy_audio for many noise levels at once (same samples as calling noisy_audio for each level in turn)
+  ### <Variable>           : snrs = list of SNRs (softer-louder of each level)
+  ### <Output>             : list of noisy audio numpy arrays, one per level
+
+  noisy_lst = []
+  for noisyspeech, noisy_rms_level in segmental_snr_mixer_multi(params = params, clean = clean, noise = noise, snrs = snrs, generator = True):
+    noisy_lst.append(quantize_int16(noisyspeech, copy = False) if quantize else noisyspeech.astype(np.float32))
+  return noisy_lst
+
+def add_noise(audio_dir,noise_dir, cfg_filedir,louder=0,softer=0,quantize=True,output_dir=None):
+  ### <Purpose of Function>: Add noise (optional varying volumes) to audio
+  ### <Variable>           : audio_dir = timit.wav file
+  ###                        noise_dir = noise.wav file (or NoiseBank)
+  ###                        cfg_filedir = cfg file used for setting params
+  ###                        louder = integer input to increase volume of noise
+  ###                        quantize = False to write the float32 samples as they are (no int16 min-max scaling)
+  ###                        output_dir = folder for the new file (default: same folder as audio_dir)
+  ### <Output>             : new audio file with noise exported same file directory as audio_dir with new label,
+  ###                        returns its directory
 
-  #for clean
-  clean_scaled = minmax_scale.fit_transform(clean.reshape(-1,1))
-  clean_scaled = clean_scaled.astype(np.int16)
+  import scipy.io.wavfile as wf
 
-  #for noisy
-  noisy_scaled = minmax_scale.fit_transform(noisyspeech.reshape(-1,1))
-  noisy_scaled = noisy_scaled.astype(np.int16)
+  #Load params, audio and noise
+  params = load_params(cfg_filedir)
+  clean = load_audio(audio_dir)
+  noisy = noisy_audio(clean, _load_noise(noise_dir, len(clean)), params, louder = louder, softer = softer, quantize = quantize)
 
   #export file
   if softer-louder > 0:
-    wf.write(f"{audio_dir.split('.wav')[0]}_noise_softer{softer}dB.wav", 16000, noisy_scaled)
+    noisy_dir = f"{audio_dir.split('.wav')[0]}_noise_softer{softer}dB.wav"
   else:
-    wf.write(f"{audio_dir.split('.wav')[0]}_noise_louder{softer}dB.wav", 16000, noisy_scaled)
+    noisy_dir = f"{audio_dir.split('.wav')[0]}_noise_louder{louder}dB.wav"
+  if output_dir is not None:
+    noisy_dir = os.path.join(output_dir, os.path.basename(noisy_dir))
+  wf.write(noisy_dir, 16000, noisy.reshape(-1,1))
+  return noisy_dir
+
+#noise samples for a clean audio of length samples: from a noise file, already loaded samples or a NoiseBank segment
+def _load_noise(noise, length):
+  if isinstance(noise, NoiseBank):
+    return noise.segment(length)
+  if isinstance(noise, np.ndarray):
+    return noise
+  return load_audio(noise)
+
+#inputs of a model for the clean file and its noisy versions (int16 arrays from noisy_audio)
+def _noise_model_inputs(asr_model, timit_wav, clean, noisy_lst, noisy_paths):
+  dtype = getattr(asr_model, 'audio_dtype', None)
+  if dtype == 'float32':
+    #same samples the model would get from reading the int16 files
+    return [clean] + [noisy.astype(np.float32) / 32768 for noisy in noisy_lst]
+  if dtype == 'int16':
+    return [model_input(asr_model, timit_wav)] + noisy_lst
+  return [model_input(asr_model, timit_wav)] + noisy_paths
 
 def compare_phn_wrd_noise(timit_wav,
                           timit_phn, 
@@ -328,79 +551,84 @@ def compare_phn_wrd_noise(timit_wav,
                           asr_phn_model, 
                           asr_txt_model,
                           louder_volumes=[],
-                          softer_volumes=[]):
+                          softer_volumes=[],
+                          cache = None,
+                          phn_model_id = None,
+                          txt_model_id = None,
+                          scratch_dir = None,
+                          as_df = True):
   
   ### <Purpose of Function> : Compare Phoneme Error Rate of ASR model after adding varying levels of noise, 
   ###                         and comparing with the Word Error Rate of the ASR model after adding varying levels of noise
   ### <Input Variables>     : timit_wav             = directory for timit.wav
   ###                         timit_phn             = directory for timit.phn
   ###                         timit_txt             = directory for timit.txt
-  ###                         noise_wav             = directory for noise audio
+  ###                         noise_wav             = directory for noise audio (or its samples from data_input.load_audio,
+  ###                                                 or a NoiseBank (noise_bank.py) serving a noise segment of the same length as timit.wav)
+  ###                         cfg_filedir           = cfg file used for setting params (or params from load_params)
   ###                         asr_phn_model         = function for ASR model which generates phonemes
   ###                         asr_txt_model         = function for ASR model which generates words
   ###                         louder/softer volumes = list of integers which will increase or decrease volume 
   ###                                                 (ONLY choose either louder or softer)
+  ###                         cache                 = optional ASRCache (asr_cache.py) used for both models
+  ###                         phn/txt_model_id      = identifiers of the two models for the cache (required with cache)
+  ###                         scratch_dir           = folder for the temporary noisy .wav files of models taking a file
+  ###                                                 directory (default: system temporary folder, never the corpus).
+  ###                                                 Models marked with scheduler.audio_input get the noisy audio in memory
+  ###                         as_df                 = False to return the rows as a list of [Volume, Error Rate, Type of Error]
   ### <Output>              : dataframe showing columns (Volume, Error Rate, Type of Error (i.e WER/PER))
 
-  #ASR model phn and txt output
-  convert_wav(timit_wav,overwrite=True)
-  asr_phoneme = asr_phn_model(timit_wav) #asr model phn
-  asr_phoneme = IPA_to_TIMIT(asr_phoneme)
-  asr_txt = asr_txt_model(timit_wav) #txt model phn
+  import pandas as pd
+  import scipy.io.wavfile as wf
+
+  if cache is not None:
+    asr_phn_model = cache.cached(asr_phn_model, require_model_id(phn_model_id, 'phn_model_id'))
+    asr_txt_model = cache.cached(asr_txt_model, require_model_id(txt_model_id, 'txt_model_id'))
+
+  #params and noise are only loaded here when they were not loaded once for many files
+  params = cfg_filedir if isinstance(cfg_filedir, dict) else load_params(cfg_filedir)
+  clean = load_audio(timit_wav)
+  noise = _load_noise(noise_wav, len(clean))
+
+  #add noise for every volume
+  if len(louder_volumes) != 0 :
+    volumes = [(f"+{vol}", {'louder': vol}) for vol in louder_volumes]
+  else:
+    volumes = [(f"-{vol}", {'softer': vol}) for vol in softer_volumes]
+  snrs = [level.get('softer', 0) - level.get('louder', 0) for label, level in volumes]
+  noisy_lst = noisy_audio_levels(clean, noise, params, snrs)
+
+  #ASR model phn and txt output, without and with noise (batch models get them in one call)
+  #noisy audio.wav files are only written (to a temporary folder) for models which take a file directory
+  need_files = not (takes_audio(asr_phn_model) and takes_audio(asr_txt_model))
+  with (tempfile.TemporaryDirectory(prefix = "asrassessment_", dir = scratch_dir) if need_files else nullcontext()) as scratch:
+    noisy_paths = []
+    if need_files:
+      for (label, level), noisy in zip(volumes, noisy_lst):
+        noisy_paths.append(os.path.join(scratch, f"noise{label}dB.wav"))
+        wf.write(noisy_paths[-1], 16000, noisy)
+    asr_phonemes = call_model(asr_phn_model, _noise_model_inputs(asr_phn_model, timit_wav, clean, noisy_lst, noisy_paths))
+    asr_txts = call_model(asr_txt_model, _noise_model_inputs(asr_txt_model, timit_wav, clean, noisy_lst, noisy_paths))
 
-  #Phoneme Error Rate w/o noise
   timit_phoneme = read_phn(timit_phn,string=True)
   timit_phoneme = TIMIT_to_IPA(timit_phoneme)
-  initial_per = error_rate(timit_phoneme,asr_phoneme)
-
-  #Word Error Rate w/o noise
   timit_text = file_text(timit_txt)[8:-1]
-  initial_wer = error_rate(timit_text,asr_txt,phn=False)
 
-  output_lst = [["Initial",initial_per['PER'],"PER"],["Initial",initial_wer["PER"],"WER"]]
+  output_lst = []
+  for label, asr_phoneme, asr_txt in zip(["Initial"] + [label for label, level in volumes], asr_phonemes, asr_txts):
+    #Phoneme Error Rate
+    phn_error = error_rate(timit_phoneme,IPA_to_TIMIT(asr_phoneme),tracker=None)
+    output_lst.append([label,phn_error['PER'],"PER"])
 
-  if len(louder_volumes) != 0 :
-    for vol in louder_volumes:
-      add_noise(timit_wav,noise_wav,cfg_filedir=cfg_filedir,louder=vol) #add increasing noise & create new audio.wav
-      louder_path_dir = f"{timit_wav.split('.wav')[0]}_noise_louder{vol}dB.wav"
-
-      #Phoneme ASR Model
-      asr_phoneme_noise = asr_phn_model(louder_path_dir)
-      asr_phoneme_noise = IPA_to_TIMIT(asr_phoneme_noise)
-      noise_per = error_rate(timit_phoneme,asr_phoneme_noise)
-      output_lst.append([f"+{vol}",noise_per['PER'],"PER"])
-
-      #Word ASR Model
-      asr_txt_noise = asr_txt_model(louder_path_dir)
-      noise_wer = error_rate(timit_text,asr_txt_noise,phn=False)
-      output_lst.append([f"+{vol}",noise_wer['PER'],"WER"])
-
-      #remove audio.wav
-      os.remove(louder_path_dir)
-  else:
-    for vol in softer_volumes:
-      add_noise(timit_wav,noise_wav,cfg_filedir=cfg_filedir,softer=vol) #add decreasing noise & create new audio.wav
-      softer_path_dir = f"{timit_wav.split('.wav')[0]}_noise_softer{vol}dB.wav"
-
-      #Phoneme ASR Model     
-      asr_phoneme_noise = asr_phn_model(softer_path_dir)
-      asr_phoneme_noise = IPA_to_TIMIT(asr_phoneme_noise)
-      noise_per = error_rate(timit_phoneme,asr_phoneme_noise)
-      output_lst.append([f"-{vol}",noise_per['PER'],"PER"])
-
-      #Word ASR Model
-      asr_txt_noise = asr_txt_model(softer_path_dir)
-      noise_wer = error_rate(timit_text,asr_txt_noise,phn=False)
-      output_lst.append([f"-{vol}",noise_wer['PER'],"WER"])
-      
-      #remove audio.wav
-      os.remove(softer_path_dir)
+    #Word Error Rate
+    wrd_error = error_rate(timit_text,asr_txt,phn=False,tracker=None)
+    output_lst.append([label,wrd_error['PER'],"WER"])
 
-  #Convert into dataframe
-  df = pd.DataFrame(output_lst)
-  error_rate_df = df.rename(columns = {0:"Volume", 1:"Error Rate (%)", 2:"Type of Error"})
+  if not as_df:
+    return output_lst
 
-  return error_rate_df
+  #Convert into dataframe
+  return pd.DataFrame(output_lst, columns = NOISE_COLUMNS)
 
 def compare_phn_wrd_noise_multi(audio_dict,
                                 noise_wav,
@@ -410,41 +638,132 @@ def compare_phn_wrd_noise_multi(audio_dict,
                                 DR = [0,None],
                                 SPK = [0,None],
                                 louder_volumes=[],
-                                softer_volumes=[]):
+                                softer_volumes=[],
+                                file_set = None,
+                                cache = None,
+                                phn_model_id = None,
+                                txt_model_id = None,
+                                output_path = None,
+                                flush_every = 100):
   ### <Purpose of Function> : same function as compare_phn_wrd_noise but for multiple files
   ### <Input Variables>     : audio-dict            = TIMIT["TRAIN"] or TIMIT["TEST"] file
-  ###                         noise_wav             = noise audio file
+  ###                                                 (or a manifest, file_set then selects "TRAIN"/"TEST")
+  ###                         noise_wav             = noise audio file (or NoiseBank, see compare_phn_wrd_noise)
   ###                         asr_phn_model         = function for ASR model which generates phonemes
   ###                         asr_txt_model         = function for ASR model which generates words
   ###                         DR                    = list of range of DR selected
   ###                         SPK                   = range of speakers within DR selected 
   ###                         louder/softer volumes = list of integers which will increase or decrease volume 
   ###                                                 (ONLY choose either louder or softer)
+  ###                         cache/phn_model_id/txt_model_id = see compare_phn_wrd_noise
+  ###                         output_path           = optional .csv file or .parquet folder the results are written to as they
+  ###                                                 come (with a "File" column). Files already in output_path are skipped,
+  ###                                                 so an interrupted run continues where it stopped
+  ###                         flush_every           = number of timit wav files per write to output_path
   ### <Output>              : dataframe showing columns (Volume, Error Rate, Type of Error (i.e WER/PER)) 
-  ###                         for multiple timit wav files
-
-
-  #file types 
-  type_lst = ['wav','phn','txt']
-  
-  #initiat df
-  error_rate_df = pd.DataFrame({"Volume": [], "Error Rate (%)":[],"Type of Error":[]})
-
-  for DR_index in list(audio_dict.keys())[DR[0]:DR[1]]:
-    for speaker in tqdm(list(audio_dict[DR_index].keys())[SPK[0]:SPK[1]]):
-      for i in range(len(audio_dict[DR_index][speaker]['wav'])):
-        compare_df = compare_phn_wrd_noise(timit_wav = audio_dict[DR_index][speaker]['wav'][i] ,
-                                           timit_phn = audio_dict[DR_index][speaker]['phn'][i], 
-                                           timit_txt = audio_dict[DR_index][speaker]['txt'][i],
-                                           noise_wav = noise_wav,
-                                           cfg_filedir=cfg_filedir,
-                                           asr_phn_model = asr_phn_model, 
-                                           asr_txt_model = asr_txt_model,
-                                           louder_volumes= louder_volumes,
-                                           softer_volumes= softer_volumes)
-        error_rate_df = error_rate_df.append(compare_df)
-
-  return error_rate_df
+  ###                         for multiple timit wav files (+ "File" column, for every file in output_path, with output_path)
+
+  import pandas as pd
+  from tqdm import tqdm
+
+  #noise and cfg params are loaded once for every file
+  if not isinstance(noise_wav, (np.ndarray, NoiseBank)):
+    noise_wav = load_audio(noise_wav)
+  cfg_filedir = cfg_filedir if isinstance(cfg_filedir, dict) else load_params(cfg_filedir)
+  if cache is not None:
+    require_model_id(phn_model_id, 'phn_model_id')
+    require_model_id(txt_model_id, 'txt_model_id')
+
+  #(wav, phn, txt) of every file selected
+  if is_manifest(audio_dict):
+    rows = select_manifest(audio_dict, file_set = file_set, DR = DR, SPK = SPK)
+    file_lst = list(zip(rows['wav'], rows['phn'], rows['txt']))
+  else:
+    file_lst = [(speaker_dict['wav'][i], speaker_dict['phn'][i], speaker_dict['txt'][i])
+                for DR_index in list(audio_dict.keys())[DR[0]:DR[1]]
+                for speaker_dict in list(audio_dict[DR_index].values())[SPK[0]:SPK[1]]
+                for i in range(len(speaker_dict['wav']))]
+
+  writer = None
+  if output_path is not None:
+    writer = _NoiseResultWriter(output_path)
+    file_lst = [files for files in file_lst if files[0] not in writer.done]
+
+  #rows are collected per column and turned into one dataframe at the end (or written every flush_every files)
+  columns = {col: [] for col in NOISE_COLUMNS + ["File"]}
+  for n_files, (timit_wav, timit_phn, timit_txt) in enumerate(tqdm(file_lst), 1):
+    output_lst = compare_phn_wrd_noise(timit_wav = timit_wav,
+                                       timit_phn = timit_phn,
+                                       timit_txt = timit_txt,
+                                       noise_wav = noise_wav,
+                                       cfg_filedir=cfg_filedir,
+                                       asr_phn_model = asr_phn_model,
+                                       asr_txt_model = asr_txt_model,
+                                       louder_volumes= louder_volumes,
+                                       softer_volumes= softer_volumes,
+                                       cache = cache,
+                                       phn_model_id = phn_model_id,
+                                       txt_model_id = txt_model_id,
+                                       as_df = False)
+    for row in output_lst:
+      for col, value in zip(NOISE_COLUMNS, row):
+        columns[col].append(value)
+      columns["File"].append(timit_wav)
+
+    if writer is not None and (n_files % flush_every == 0 or n_files == len(file_lst)):
+      writer.write(pd.DataFrame(columns))
+      columns = {col: [] for col in columns}
+
+  if writer is not None:
+    return writer.read()
+  return pd.DataFrame({col: columns[col] for col in NOISE_COLUMNS})
+
+class _NoiseResultWriter:
+
+  ### Results of compare_phn_wrd_noise_multi written as they come, to a .csv file (appended) or
+  ### a .parquet folder (one part file per write). done = files already in the output
+
+  def __init__(self, output_path):
+    import pandas as pd
+
+    self.output_path = output_path
+    self.parquet = output_path.endswith('.parquet')
+    self.done = set()
+    if self.parquet:
+      os.makedirs(output_path, exist_ok = True)
+      self.n_parts = len(self._parts())
+      if self.n_parts:
+        self.done = set(pd.read_parquet(output_path, columns = ["File"])["File"])
+    elif os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+      self.done = set(pd.read_csv(output_path, usecols = ["File"], dtype = str)["File"])
+
+  def _parts(self):
+    return sorted(name for name in os.listdir(self.output_path) if name.startswith('part-') and name.endswith('.parquet'))
+
+  def write(self, df):
+    if len(df) == 0:
+      return
+    if self.parquet:
+      #written then renamed, so an interrupted write never leaves a broken part file
+      name = f"part-{self.n_parts:06d}.parquet"
+      tmp = os.path.join(self.output_path, f".{name}.tmp")
+      df.to_parquet(tmp, index = False)
+      os.replace(tmp, os.path.join(self.output_path, name))
+      self.n_parts += 1
+    else:
+      header = not (os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0)
+      df.to_csv(self.output_path, mode = 'a', header = header, index = False)
+
+  def read(self):
+    import pandas as pd
+
+    if self.parquet:
+      if not self._parts():
+        return pd.DataFrame(columns = NOISE_COLUMNS + ["File"])
+      return pd.read_parquet(self.output_path)
+    if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0:
+      return pd.DataFrame(columns = NOISE_COLUMNS + ["File"])
+    return pd.read_csv(self.output_path, dtype = {"Volume": str, "Type of Error": str, "File": str})
 
 # ## Initial add_noise function
 def initial_add_noise(audio_dir,noise_dir,louder=0,softer=0):
@@ -454,6 +773,8 @@ def initial_add_noise(audio_dir,noise_dir,louder=0,softer=0):
   ###                        louder = integer input to increase volume of noise
   ### <Output>             : new audio file with noise exported same file directory as audio_dir with new label         
 
+  from pydub import AudioSegment
+
   sound1 = AudioSegment.from_file(audio_dir, format="wav")
   sound2 = AudioSegment.from_file(noise_dir, format="wav")
 
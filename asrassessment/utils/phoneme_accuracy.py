@@ -0,0 +1,160 @@
+#Mergeable per phoneme accuracy statistics: a fixed size replacement for the lists of % of compare_phonemes_perc
+
+#global imports
+import json
+import numpy as np
+
+class PhonemeAccuracyAccumulator:
+
+  ### <Purpose of class>: Keep, for every phoneme, the distribution of the % correctly predicted per recording
+  ###                     (what compare_phonemes_perc returns as lists) as counts and a fixed histogram, so the size
+  ###                     does not depend on the number of recordings and results of different speakers, processes or
+  ###                     machines can be merged
+  ### <Input variables>:  bins     = number of histogram bins over 0-100% (100 = 1% wide bins)
+  ###                     phonemes = optional phonemes to keep first, in this order (i.e. keys of phn_counter_dict)
+  ###
+  ### Per phoneme: number of recordings, sum of % (mean), min/max, histogram of % (count and sum of % per bin), and the
+  ### total correct/wrong predictions over all recordings. Quantiles and box statistics are estimated from the histogram:
+  ### exact when the recordings of a bin share the same % (i.e. 50%, 66.7%), otherwise within a bin width.
+
+  def __init__(self, bins = 100, phonemes = None):
+    self.bins = bins
+    self.stats = {}
+    self.add_phonemes(phonemes or [])
+
+  def add_phonemes(self, phonemes):
+    ### register phonemes (without recording) so they keep this order, i.e. the order of the box plot
+    for phoneme in phonemes:
+      self._get(phoneme)
+
+  def _get(self, phoneme):
+    if phoneme not in self.stats:
+      self.stats[phoneme] = {'n': 0, 'sum': 0.0, 'min': np.inf, 'max': -np.inf, 'correct': 0, 'wrong': 0,
+                             'hist': np.zeros(self.bins, dtype = np.int64), 'bin_sum': np.zeros(self.bins)}
+    return self.stats[phoneme]
+
+  def add(self, phoneme, percentage, correct = 0, wrong = 0):
+    ### add the % correctly predicted of phoneme for one recording
+    stat = self._get(phoneme)
+    stat['n'] += 1
+    stat['sum'] += percentage
+    stat['min'] = min(stat['min'], percentage)
+    stat['max'] = max(stat['max'], percentage)
+    stat['correct'] += correct
+    stat['wrong'] += wrong
+    index = min(int(percentage / 100 * self.bins), self.bins - 1)
+    stat['hist'][index] += 1
+    stat['bin_sum'][index] += percentage
+
+  def update(self, phoneme_counts):
+    ### add one recording: phoneme_counts = {phoneme: [correct, wrong]} (see sequence_match)
+    for phoneme, (correct, wrong) in phoneme_counts.items():
+      self.add(phoneme, correct / (correct + wrong) * 100, correct, wrong)
+
+  def merge(self, other):
+    ### add the recordings of another accumulator (same bins) to this one, returns self
+    if other.bins != self.bins:
+      raise ValueError(f"Cannot merge accumulators with {self.bins} and {other.bins} bins")
+    for phoneme, other_stat in other.stats.items():
+      stat = self._get(phoneme)
+      for key in ['n', 'sum', 'correct', 'wrong', 'hist', 'bin_sum']:
+        stat[key] = stat[key] + other_stat[key]
+      stat['min'] = min(stat['min'], other_stat['min'])
+      stat['max'] = max(stat['max'], other_stat['max'])
+    return self
+
+  def __iadd__(self, other):
+    return self.merge(other)
+
+  @classmethod
+  def merged(cls, accumulators):
+    ### one accumulator with the recordings of every accumulator of the list
+    accumulators = list(accumulators)
+    result = cls(bins = accumulators[0].bins if accumulators else 100)
+    for accumulator in accumulators:
+      result.merge(accumulator)
+    return result
+
+  def __len__(self):
+    return len(self.stats)
+
+  def count(self, phoneme):
+    return self.stats[phoneme]['n'] if phoneme in self.stats else 0
+
+  def mean(self, phoneme):
+    stat = self.stats.get(phoneme)
+    return float(stat['sum'] / stat['n']) if stat and stat['n'] else np.nan
+
+  def _values(self, stat):
+    #filled bins and the mean % of each (every recording of a bin is taken as the bin mean)
+    filled = np.flatnonzero(stat['hist'])
+    return stat['hist'][filled], stat['bin_sum'][filled] / stat['hist'][filled]
+
+  def quantile(self, phoneme, q):
+
+    ### <Output variable>: Returns the q quantile(s) (0-1) of the % of phoneme, nan if the phoneme has no recording
+    ###                    (linear as np.percentile, exact when the recordings of each bin have the same %)
+    stat = self.stats.get(phoneme)
+    if not stat or stat['n'] == 0:
+      return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+    counts, values = self._values(stat)
+    ends = np.cumsum(counts)
+    rank = np.asarray(q, dtype = np.float64) * (stat['n'] - 1)
+    below = values[np.searchsorted(ends, np.floor(rank), side = 'right')]
+    above = values[np.searchsorted(ends, np.ceil(rank), side = 'right')]
+    return below + (above - below) * (rank - np.floor(rank))
+
+  def box_stats(self, whisker = 1.5, max_outliers = 50):
+
+    ### <Output variable>: Returns {phoneme: box statistics} in the format of box_stats.box_stats (None without recording),
+    ###                    estimated from the histogram (whiskers and outliers are bin means)
+    result = {}
+    for phoneme, stat in self.stats.items():
+      if stat['n'] == 0:
+        result[phoneme] = None
+        continue
+      q1, median, q3 = self.quantile(phoneme, [0.25, 0.5, 0.75])
+      iqr = q3 - q1
+      counts, values = self._values(stat)
+      inside = (values >= q1 - whisker * iqr) & (values <= q3 + whisker * iqr)
+      lowerfence, upperfence = values[inside][0], values[inside][-1]
+
+      outliers = np.repeat(values, np.where(inside, 0, counts))
+      if max_outliers is not None and len(outliers) > max_outliers:
+        outliers = outliers[np.unique(np.linspace(0, len(outliers) - 1, max_outliers).round().astype(np.int64))]
+      result[phoneme] = {'q1': float(q1), 'median': float(median), 'q3': float(q3), 'mean': self.mean(phoneme),
+                         'lowerfence': float(lowerfence), 'upperfence': float(upperfence),
+                         'outliers': outliers.tolist(), 'n': int(stat['n'])}
+    return result
+
+  def to_dict(self):
+    ### JSON serializable dictionary (histograms stored sparse: {bin: [count, sum of %]})
+    return {'bins': self.bins,
+            'stats': {phoneme: {'n': stat['n'], 'sum': stat['sum'],
+                                'min': stat['min'] if stat['n'] else None, 'max': stat['max'] if stat['n'] else None,
+                                'correct': stat['correct'], 'wrong': stat['wrong'],
+                                'hist': {str(i): [int(stat['hist'][i]), float(stat['bin_sum'][i])]
+                                         for i in np.flatnonzero(stat['hist'])}}
+                      for phoneme, stat in self.stats.items()}}
+
+  @classmethod
+  def from_dict(cls, data):
+    accumulator = cls(bins = data['bins'])
+    for phoneme, saved in data['stats'].items():
+      stat = accumulator._get(phoneme)
+      stat.update({'n': saved['n'], 'sum': saved['sum'], 'correct': saved['correct'], 'wrong': saved['wrong'],
+                   'min': saved['min'] if saved['min'] is not None else np.inf,
+                   'max': saved['max'] if saved['max'] is not None else -np.inf})
+      for i, (count, bin_sum) in saved['hist'].items():
+        stat['hist'][int(i)] = count
+        stat['bin_sum'][int(i)] = bin_sum
+    return accumulator
+
+  def save(self, path):
+    with open(path, 'w') as f:
+      json.dump(self.to_dict(), f, ensure_ascii = False, separators = (',', ':'))
+
+  @classmethod
+  def load(cls, path):
+    with open(path) as f:
+      return cls.from_dict(json.load(f))
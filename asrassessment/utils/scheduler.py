@@ -0,0 +1,216 @@
+#Scheduler to run an ASR model over many files with a pool of threads or processes
+
+#global imports
+import os
+import threading
+import warnings
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+## BATCH PROTOCOL
+#A model function normally takes one input (.wav file directory) and returns one output.
+#A model marked with @batched takes a list of inputs and returns a list of outputs (same order),
+#and the pipelines group the inputs into batches bounded by number of inputs and/or total duration.
+
+#Decorator to mark a model as accepting a list of inputs
+def batched(max_batch_size = 16, max_batch_duration = None):
+
+  ### <Input variables>: max_batch_size = maximum number of inputs per call (None = no limit)
+  ###                    max_batch_duration = maximum total audio duration (s) per call (None = no limit)
+  ### Usage:             @batched(max_batch_size=32)
+  ###                    def my_model(file_dirs): return [... for file_dir in file_dirs]
+  def mark(asr_model):
+    asr_model.batch = True
+    asr_model.max_batch_size = max_batch_size
+    asr_model.max_batch_duration = max_batch_duration
+    return asr_model
+  return mark
+
+def is_batch_model(asr_model):
+  return bool(getattr(asr_model, 'batch', False))
+
+## AUDIO INPUT PROTOCOL
+#A model marked with @audio_input gets the decoded samples (numpy array, 16 kHz mono) instead of the .wav file directory,
+#so the pipelines never have to write a converted copy of the audio to disk for it.
+
+#Decorator to mark a model as accepting numpy audio
+def audio_input(dtype = 'float32'):
+
+  ### <Input variables>: dtype = 'float32' (samples in [-1, 1)) or 'int16' (raw samples)
+  ### Usage:             @audio_input()
+  ###                    def my_model(audio): return ...
+  ###                    (combined with @batched, the model gets a list of arrays)
+  def mark(asr_model):
+    asr_model.audio_dtype = dtype
+    return asr_model
+  return mark
+
+def takes_audio(asr_model):
+  return getattr(asr_model, 'audio_dtype', None) is not None
+
+#estimate of the duration (s) of a 16 bit mono .wav file from its size (TIMIT: 16 kHz, 1024 bytes header)
+def estimate_duration(file_dir, fs = 16000):
+  return max(os.path.getsize(file_dir) - 1024, 0) / (2 * fs)
+
+#Function to split inputs into batches for a batch model
+def make_batches(n_items, max_batch_size = None, durations = None, max_batch_duration = None):
+
+  ### <Output variable>: Returns list of lists of indices (consecutive, in order)
+  batches = []
+  current = []
+  current_duration = 0.0
+  for index in range(n_items):
+    duration = durations[index] if durations is not None else 0.0
+    full = max_batch_size is not None and len(current) >= max_batch_size
+    too_long = max_batch_duration is not None and current and current_duration + duration > max_batch_duration
+    if current and (full or too_long):
+      batches.append(current)
+      current = []
+      current_duration = 0.0
+    current.append(index)
+    current_duration += duration
+  if current:
+    batches.append(current)
+  return batches
+
+#Function to call a model (batch model or one input per call) on a list of inputs
+def call_model(asr_model, inputs, durations = None, **kwargs):
+
+  ### <Input variables>: inputs = list of inputs (.wav file directories, or 16 kHz numpy audio, see audio_input)
+  ###                    durations = optional durations (s) of the inputs, estimated from the file size/samples if needed
+  ###                    kwargs = passed to the model on every call
+  ### <Output variable>: Returns list of outputs in the same order as inputs
+  if not is_batch_model(asr_model):
+    return [asr_model(item, **kwargs) for item in inputs]
+
+  max_batch_duration = getattr(asr_model, 'max_batch_duration', None)
+  if max_batch_duration is not None and durations is None:
+    durations = [estimate_duration(item) if isinstance(item, str) else len(item) / 16000 for item in inputs]
+  outputs = []
+  for batch in make_batches(len(inputs), getattr(asr_model, 'max_batch_size', None), durations, max_batch_duration):
+    outputs.extend(asr_model([inputs[index] for index in batch], **kwargs))
+  return outputs
+
+#call a batch model once with a list of inputs, checking it returned one output per input
+def call_batch(asr_model, inputs):
+  outputs = asr_model(inputs)
+  if len(outputs) != len(inputs):
+    raise ValueError(f"batch model returned {len(outputs)} outputs for {len(inputs)} inputs")
+  return outputs
+
+#model of the current worker (one per thread for the thread backend, one per process for the process backend)
+_worker = threading.local()
+
+def _init_worker(asr_model, model_factory):
+  _worker.model = model_factory() if model_factory is not None else asr_model
+
+class TaskFailure:
+
+  ### <Purpose of class>: Error of one failed item of run_model, with the traceback of the worker it was raised in
+  ###                     (strings only, so it can be sent back from a worker process)
+  ### str(failure) is the error as "Type: message", failure.traceback the formatted traceback
+
+  def __init__(self, error, traceback = ""):
+    self.error = error
+    self.traceback = traceback
+
+  def __str__(self):
+    return self.error
+
+  def __repr__(self):
+    return f"TaskFailure({self.error!r})"
+
+def _run_task(task, item):
+  #never raise in a worker, failures are returned so one bad file does not stop the others
+  try:
+    return True, task(_worker.model, item)
+  except Exception as e:
+    return False, TaskFailure(f"{type(e).__name__}: {e}", traceback.format_exc())
+
+def _run_single_task(task, item):
+  return [_run_task(task, item)]
+
+def _run_batch_task(batch_task, batch):
+  #a failing batch is run again one input at a time to find which inputs fail
+  ok, outputs = _run_task(batch_task, batch)
+  if ok and len(outputs) != len(batch):
+    ok, outputs = False, TaskFailure(f"ValueError: batch model returned {len(outputs)} outputs for {len(batch)} inputs")
+  if ok:
+    return [(True, output) for output in outputs]
+  if len(batch) == 1:
+    return [(ok, outputs)]
+  return [_run_batch_task(batch_task, [item])[0] for item in batch]
+
+#Function to run task(model, item) for every item
+def run_model(task, items, asr_model = None, model_factory = None, workers = 1, backend = "thread", desc = None,
+              batch_task = None, durations = None):
+
+  ### <Purpose of function>: Run an ASR model over many files, in parallel if workers > 1
+  ### <Input variables>:     task = function(model, item) -> output, i.e. lambda model, file_dir: model(file_dir)
+  ###                               (must be a module level function/functools.partial for backend = "process")
+  ###                        items = list of inputs (i.e. .wav file directories)
+  ###                        asr_model = model function, shared by every worker
+  ###                        model_factory = function without input returning the model, called once per worker
+  ###                                        instead of asr_model (for models that are slow to load or not thread safe)
+  ###                        workers = number of threads/processes (1 = run in this process, one file at a time)
+  ###                        backend = "thread" for models releasing the GIL (i.e. torch/onnx), "process" for pure python models
+  ###                        batch_task = function(model, list of items) -> list of outputs, used instead of task when the
+  ###                                     model (or model_factory) is marked with @batched
+  ###                        durations = optional durations (s) of the items for max_batch_duration
+  ### <Output variable>:     Returns (list of outputs in the same order as items, None for a failed item,
+  ###                                 dictionary {index of failed item: TaskFailure})
+  ###                        Warns with the number of failed items and the first error, raises RuntimeError if every item failed
+
+  if asr_model is None and model_factory is None:
+    raise ValueError("Either asr_model or model_factory is required")
+  if backend not in ("thread", "process"):
+    raise ValueError(f"Unknown backend '{backend}', use 'thread' or 'process'")
+
+  from tqdm import tqdm
+
+  outputs = [None] * len(items)
+  failures = {}
+  progress = tqdm(total = len(items), desc = desc)
+
+  def collect(index, result):
+    ok, value = result
+    if ok:
+      outputs[index] = value
+    else:
+      failures[index] = value
+    progress.update(1)
+
+  #jobs: (function run in the worker, its input, indices of the items it covers)
+  declared = asr_model if asr_model is not None else model_factory
+  if batch_task is not None and is_batch_model(declared):
+    max_batch_duration = getattr(declared, 'max_batch_duration', None)
+    if max_batch_duration is not None and durations is None:
+      durations = [estimate_duration(item) for item in items]
+    jobs = [(_run_batch_task, batch_task, [items[index] for index in batch], batch)
+            for batch in make_batches(len(items), getattr(declared, 'max_batch_size', None), durations, max_batch_duration)]
+  else:
+    jobs = [(_run_single_task, task, item, [index]) for index, item in enumerate(items)]
+
+  try:
+    if workers <= 1:
+      _init_worker(asr_model, model_factory)
+      for run, job_task, job_input, indices in jobs:
+        for index, result in zip(indices, run(job_task, job_input)):
+          collect(index, result)
+    else:
+      pool_class = ThreadPoolExecutor if backend == "thread" else ProcessPoolExecutor
+      with pool_class(max_workers = workers, initializer = _init_worker, initargs = (asr_model, model_factory)) as pool:
+        futures = {pool.submit(run, job_task, job_input): indices for run, job_task, job_input, indices in jobs}
+        for future in as_completed(futures):
+          for index, result in zip(futures[future], future.result()):
+            collect(index, result)
+  finally:
+    progress.close()
+
+  if failures:
+    first = failures[min(failures)]
+    if len(failures) == len(items):
+      raise RuntimeError(f"The model failed on all {len(items)} items, first error: {first}\n{first.traceback}")
+    warnings.warn(f"The model failed on {len(failures)} of {len(items)} items (None as output), first error: {first}",
+                  RuntimeWarning, stacklevel = 2)
+  return outputs, failures
@@ -8,7 +8,8 @@
 from .generalfunc import split_string
 
 #global import
-import pandas as pd
+import numpy as np
+from collections import namedtuple
 
 comapping = {
             "Vowels (Monophthongs)":
@@ -100,6 +101,11 @@ TIMIT_to_IPA_mapping ={
     "vi":"v", #not in TIMIT 61 phoneset 
 }
 
+#map every phoneme of a list through a mapping dictionary (phonemes not in the mapping are kept as they are)
+def _translate(phn_list, mapping):
+  get = mapping.get
+  return '/'.join([get(phn, phn) for phn in phn_list])
+
 #for ASR model phoneme to a standardized phoneme comparison
 def IPA_to_TIMIT(ipa_list,split = True):
   
@@ -107,18 +113,7 @@ def IPA_to_TIMIT(ipa_list,split = True):
   
   if split:
     ipa_list = split_string(ipa_list)
-
-  converted_list = []
-  for IPA_letter in ipa_list:
-    loop_count= 0
-    for key,value in IPA_to_TIMIT_mapping.items():
-      if IPA_letter == key:
-        converted_list.append(value)
-      else:
-        loop_count += 1
-      if loop_count == len(IPA_to_TIMIT_mapping.keys()):
-        converted_list.append(IPA_letter)
-  return '/'.join(converted_list)
+  return _translate(ipa_list, IPA_to_TIMIT_mapping)
 
 #for TIMIT phoneme to a standardized phoneme comparison
 def TIMIT_to_IPA(timit_list,split = True):
@@ -126,32 +121,68 @@ def TIMIT_to_IPA(timit_list,split = True):
   #### INPUT VALUE IS LIST OF INDIVIDUAL PHONEME STRINGS ####
   if split:
     timit_list = split_string(timit_list)
+  return _translate(timit_list, TIMIT_to_IPA_mapping)
+
+#IPA_to_TIMIT for a whole list of utterances in one call
+def IPA_to_TIMIT_list(utterances,split = True):
+
+  #### INPUT VALUE IS LIST OF PHONEME STRINGS (or list of lists of phonemes if split = False) ####
+  return [_translate(utt.split('/') if split else utt, IPA_to_TIMIT_mapping) for utt in utterances]
+
+#TIMIT_to_IPA for a whole list of utterances in one call
+def TIMIT_to_IPA_list(utterances,split = True):
+
+  #### INPUT VALUE IS LIST OF PHONEME STRINGS (or list of lists of phonemes if split = False) ####
+  return [_translate(utt.split('/') if split else utt, TIMIT_to_IPA_mapping) for utt in utterances]
 
-  converted_list = []
-  for TIMIT_letter in timit_list:
-    loop_count= 0
-    for key,value in TIMIT_to_IPA_mapping.items():
-      if TIMIT_letter == key:
-        converted_list.append(value)
-      else:
-        loop_count += 1
-      if loop_count == len(TIMIT_to_IPA_mapping.keys()):
-        converted_list.append(TIMIT_letter)
-  return '/'.join(converted_list)
+#parsed .PHN file: start/end sample of each phoneme (int numpy arrays) and the phonemes
+PHN = namedtuple('PHN', ['start', 'end', 'phoneme'])
+
+##parse .PHN file ("<start> <end> <phoneme>" per line)
+def parse_phn(filename, inventory = None):
+
+  ### inventory = optional PhoneInventory (utils/inventory.py) to get the phonemes as an ID array instead of a list
+  with open(filename) as f:
+    fields = f.read().split()
+  if len(fields) % 3 != 0:
+    raise ValueError(f"{filename} is not a valid .PHN file (expected 'start end phoneme' on every line)")
+
+  start = np.array(fields[0::3], dtype = np.int64)
+  end = np.array(fields[1::3], dtype = np.int64)
+  phoneme = fields[2::3]
+  if inventory is not None:
+    phoneme = inventory.encode(phoneme, split = False)
+  return PHN(start, end, phoneme)
 
 ##loading file PHN/CSV into df
 def read_phn(filename,df=False,string=False):
-  phn_df = pd.read_csv(filename, names=['header'])
-  phn_df = phn_df.header.str.split(pat=' ',expand=True)
-  phn_df.columns = ['start','end','phoneme']
-  
-  #convert to string
-  phn_string = '/'.join(phn_df['phoneme'].tolist())
+
+  ### string = True returns the phonemes joined with '/'
+  ### df = True returns a dataframe with columns (start, end, phoneme), start/end as integers
+  ### otherwise returns the PHN namedtuple of parse_phn
+  phn = parse_phn(filename)
   
   if string == True:
-    return phn_string
+    return '/'.join(phn.phoneme)
   if df == True:
-    return phn_df
+    import pandas as pd
+    return pd.DataFrame({'start': phn.start, 'end': phn.end, 'phoneme': phn.phoneme})
+  return phn
+
+##parse every .PHN file of a TIMIT set in one pass
+def read_phn_bulk(set_dict, DR = [0,None], string = False, inventory = None):
+
+  ### set_dict = TIMIT_dict["TRAIN"] or TIMIT_dict["TEST"] (see timit_load.TIMIT_file)
+  ### DR = range of DR files to read
+  ### Returns dictionary {phn file directory: PHN namedtuple (or '/' joined string if string = True)}
+  ### inventory = optional PhoneInventory to get the phonemes as ID arrays (ignored if string = True)
+  phn_dict = {}
+  for DR_index in list(set_dict.keys())[DR[0]:DR[1]]:
+    for speaker in set_dict[DR_index].values():
+      for file_dir in speaker.get('phn', speaker.get('PHN', [])):
+        phn = parse_phn(file_dir, inventory = None if string else inventory)
+        phn_dict[file_dir] = '/'.join(phn.phoneme) if string else phn
+  return phn_dict
 
 #function to read text given file input
 def file_text(file):
@@ -3,41 +3,125 @@
 ##iteratively create dictionary for TIMIT FILE
 # TIMIT__dict[TRAIN/TEST][DR?][SPEAKER?][TYPE OF FILE][index of file]
 
-from glob import glob
+import os
+import json
+import hashlib
 
-def TIMIT_file(file_directory,capital=False):
-    
-    if capital: 
-        train_test_directory = glob(f"{file_directory}/T*")#use own file directory
+from .generalfunc import cache_dir
+
+remove_lst = ['wav_SA1real', 'wav_SA1rec','wav_SA1wisp'] #files to remove from dict
+
+INDEX_VERSION = 1
+
+def TIMIT_file(file_directory,capital=False,use_index=True,index_path=None):
+
+    ### use_index  = keep the result in an on-disk index (json) and reuse it as long as no directory of the
+    ###              corpus was modified (mtime of every set/DR/speaker directory is checked)
+    ### index_path = file for the index, default is ~/.cache/asrassessment/ (or $XDG_CACHE_HOME) so the corpus is never written to
+
+    if not use_index:
+        return _scan_TIMIT(file_directory, capital)[0]
+
+    if index_path is None:
+        index_path = default_index_path(file_directory, capital)
+
+    tree = _load_index(file_directory, index_path, capital)
+    if tree is None:
+        tree, mtimes = _scan_TIMIT(file_directory, capital, relative=True)
+        if mtimes:
+            _save_index(index_path, tree, mtimes, capital)
+
+    #index stores paths relative to the corpus directory
+    return {set_dir: {DR_dir: {speaker_dir: {filetype: [f"{file_directory}/{rel}" for rel in lst] for filetype, lst in files.items()}
+                               for speaker_dir, files in speakers.items()}
+                      for DR_dir, speakers in DRs.items()}
+            for set_dir, DRs in tree.items()}
+
+def default_index_path(file_directory, capital=False):
+    key = hashlib.sha1(f"{os.path.abspath(file_directory)}|{capital}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"timit_index_{key}.json")
+
+def _listdir(directory):
+    #non hidden entries in directory order (same entries/order as glob(f"{directory}/*"))
+    try:
+        with os.scandir(directory) as it:
+            return [entry for entry in it if not entry.name.startswith('.')]
+    except (NotADirectoryError, FileNotFoundError):
+        return []
+
+def _scan_TIMIT(file_directory, capital=False, relative=False):
+    ### single os.scandir walk over the corpus
+    ### Returns (TIMIT_dict, {directory relative to file_directory: mtime})
+
+    if capital:
+        prefix = 'T'
         lst_filetypes =['PHN','TXT','WAV','WRD']
     else:
-        train_test_directory = glob(f"{file_directory}/t*")#use own file directory
+        prefix = 't'
         lst_filetypes =['phn','txt','wav','wrd']
 
+    TIMIT_dict = {}
+    if not os.path.isdir(file_directory):
+        return TIMIT_dict, {}
+    mtimes = {'': os.stat(file_directory).st_mtime_ns}
+
     #create TRAIN/TEST key
-    TIMIT_dict = {i.split("/")[-1]:{} for i in train_test_directory} 
-
-    for file_type in train_test_directory:
-        files = glob(f"{file_type}/*") #get directory for DRs
-        filetype_dir= f"{file_type.split('/')[-1]}" #create variable for dict by filetype
-        TIMIT_dict[filetype_dir] = {fil.split('/')[-1]:{} for fil in files} #create DR dict within the TRAIN/TEST dict
-    
-        for DR in files:
-            speakers = glob(f"{DR}/*") #get directory for speakers
-            DR_dir = f"{DR.split('/')[-1]}" #create variable for dict by DR
-            TIMIT_dict[filetype_dir][DR_dir] = {speaker.split('/')[-1]:{} for speaker in speakers} #create speaker dict within the DR dict
-        
-            for speaker in speakers:
-                recordings = glob(f"{speaker}/*")
-                speaker_dir = f"{speaker.split('/')[-1]}"
-        
-                #seperate dict into file type (.phn, .wav, .txt)
-                TIMIT_dict[filetype_dir][DR_dir][speaker_dir]= {filetype:[] for filetype in lst_filetypes}
-        
-                #seperate directory into file type
+    for set_entry in _listdir(file_directory):
+        if not set_entry.name.startswith(prefix):
+            continue
+        set_dir = set_entry.name
+        TIMIT_dict[set_dir] = {} #create DR dict within the TRAIN/TEST dict
+        if set_entry.is_dir():
+            mtimes[set_dir] = set_entry.stat().st_mtime_ns
+
+        for DR_entry in _listdir(set_entry.path):
+            DR_dir = DR_entry.name
+            TIMIT_dict[set_dir][DR_dir] = {} #create speaker dict within the DR dict
+            if DR_entry.is_dir():
+                mtimes[f"{set_dir}/{DR_dir}"] = DR_entry.stat().st_mtime_ns
+
+            for speaker_entry in _listdir(DR_entry.path):
+                speaker_dir = speaker_entry.name
+                rel_dir = f"{set_dir}/{DR_dir}/{speaker_dir}"
+                if speaker_entry.is_dir():
+                    mtimes[rel_dir] = speaker_entry.stat().st_mtime_ns
+                recordings = [entry.name for entry in _listdir(speaker_entry.path)]
+                base_dir = rel_dir if relative else f"{file_directory}/{rel_dir}"
+
+                #seperate directory into file type (.phn, .wav, .txt)
+                speaker_dict = {}
                 for filetype in lst_filetypes:
-                    lst = sorted(list(filter(lambda x: filetype in x, recordings)))
-                    remove_lst = ['wav_SA1real', 'wav_SA1rec','wav_SA1wisp'] #files to remove from dict
-                    TIMIT_dict[filetype_dir][DR_dir][speaker_dir][filetype] = [ele for ele in lst if remove_lst[0] not in ele and remove_lst[1] not in ele and remove_lst[2] not in ele]
-            
-    return TIMIT_dict
\ No newline at end of file
+                    lst = sorted(name for name in recordings if filetype in name and not any(rm in name for rm in remove_lst))
+                    speaker_dict[filetype] = [f"{base_dir}/{name}" for name in lst]
+                TIMIT_dict[set_dir][DR_dir][speaker_dir] = speaker_dict
+
+    return TIMIT_dict, mtimes
+
+def _load_index(file_directory, index_path, capital):
+    #returns the stored (relative) TIMIT dict, or None if there is no index or the corpus changed since
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION or index.get('capital') != capital:
+        return None
+    for rel_dir, mtime in index['mtimes'].items():
+        try:
+            if os.stat(os.path.join(file_directory, rel_dir)).st_mtime_ns != mtime:
+                return None
+        except OSError:
+            return None
+    return index['tree']
+
+def _save_index(index_path, tree, mtimes, capital):
+    #the index is only a cache, a corpus on a read only location still loads without it
+    index = {'version': INDEX_VERSION, 'capital': capital, 'mtimes': mtimes, 'tree': tree}
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass
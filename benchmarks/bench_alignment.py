@@ -0,0 +1,81 @@
+#Alignment engine benchmark: python benchmarks/bench_alignment.py [--pairs 2000] [--length 40] [--repeat 5] [--min-speedup 2.0]
+#Times error_rate with engine="python" and engine="numpy" on the same TIMIT length utterance pairs (random phonemes,
+#hypotheses with ~20% substitutions/insertions/deletions), for every tracker. Exits with 1 if the engines give different
+#counts or if the numpy engine is not at least --min-speedup times faster, so keeping it stays justified.
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from asrassessment.utils.phone_error_rate import error_rate
+from synthetic_timit import PHONEMES as phonemes
+
+ENGINES = ['python', 'numpy']
+TRACKERS = [None, 'alignment', 'df']
+
+def make_pairs(n_pairs, length, seed = 0):
+  ### Returns list of (reference, hypothesis) '/' joined phoneme strings
+  rng = np.random.default_rng(seed)
+  pairs = []
+  for _ in range(n_pairs):
+    ref = [phonemes[k] for k in rng.integers(len(phonemes), size = length)]
+    hyp = []
+    for phn in ref:
+      edit = rng.random()
+      if edit < 0.1:
+        hyp.append(phonemes[rng.integers(len(phonemes))])
+      elif edit < 0.15:
+        hyp.extend([phn, phonemes[rng.integers(len(phonemes))]])
+      elif edit >= 0.2:
+        hyp.append(phn)
+    pairs.append(("/".join(ref), "/".join(hyp)))
+  return pairs
+
+def time_engines(pairs, tracker, repeat = 5):
+  ### Returns {engine: (fastest time (s) over repeat runs of every pair, counts of the last run)}
+  ### (the engines are run in turn, so a slow period of the machine affects both)
+  seconds = {engine: [] for engine in ENGINES}
+  counts = {}
+  for _ in range(repeat):
+    for engine in ENGINES:
+      start = time.perf_counter()
+      results = [error_rate(ref, hyp, engine = engine, tracker = tracker) for ref, hyp in pairs]
+      seconds[engine].append(time.perf_counter() - start)
+      counts[engine] = [result if tracker is None else result[0] for result in results]
+  return {engine: (min(seconds[engine]), counts[engine]) for engine in ENGINES}
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--pairs', type = int, default = 2000)
+  parser.add_argument('--length', type = int, default = 40)
+  parser.add_argument('--repeat', type = int, default = 5)
+  parser.add_argument('--min-speedup', type = float, default = 2.0)
+  args = parser.parse_args()
+
+  pairs = make_pairs(args.pairs, args.length)
+  failed = False
+  report = {}
+  for tracker in TRACKERS:
+    timings = time_engines(pairs, tracker, args.repeat)
+    (python_seconds, python_counts), (numpy_seconds, numpy_counts) = timings['python'], timings['numpy']
+    speedup = python_seconds / numpy_seconds
+    same = python_counts == numpy_counts
+    report[str(tracker)] = {'python_seconds': round(python_seconds, 4), 'numpy_seconds': round(numpy_seconds, 4),
+                            'speedup': round(speedup, 2), 'same_counts': same}
+    #the df tracker is dominated by building the dataframe, only the counts are checked there
+    if not same or (tracker != 'df' and speedup < args.min_speedup):
+      failed = True
+    print(f"tracker={str(tracker):10s} python {python_seconds * 1000:8.1f} ms  numpy {numpy_seconds * 1000:8.1f} ms  "
+          f"speedup {speedup:5.2f}x  {'' if same else 'DIFFERENT COUNTS'}")
+
+  print(json.dumps(report))
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,60 @@
+#Import time regression benchmark: python benchmarks/bench_import.py [--repeat 5] [--max-seconds 1.0]
+#Every import is timed in a fresh interpreter. Exits with 1 if a module loads a heavy dependency it should
+#not need (i.e. pandas for error_rate) or takes longer than --max-seconds.
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+#modules to time and the heavy dependencies they must not import
+HEAVY = ['pandas', 'tqdm', 'scipy', 'librosa', 'sklearn', 'pydub', 'soundfile', 'plotly', 'matplotlib']
+TARGETS = {
+  'asrassessment.utils.alignment': HEAVY,
+  'asrassessment.utils.inventory': HEAVY,
+  'asrassessment.utils.standardizer': HEAVY,
+  'asrassessment.utils.phone_error_rate': HEAVY,
+  'asrassessment.utils.corpus_convert': HEAVY,
+  'asrassessment.main': HEAVY,
+}
+
+CHILD = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def time_import(module, heavy, repeat = 5):
+  ### Returns (fastest import time (s) over repeat fresh interpreters, heavy modules loaded by the import)
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ, PYTHONPATH = os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+  results = []
+  for _ in range(repeat):
+    out = subprocess.run([sys.executable, '-c', CHILD.format(module = module, heavy = heavy)],
+                         env = env, capture_output = True, text = True, check = True)
+    results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+  return min(result['seconds'] for result in results), results[0]['loaded']
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--repeat', type = int, default = 5)
+  parser.add_argument('--max-seconds', type = float, default = 1.0)
+  args = parser.parse_args()
+
+  failed = False
+  report = {}
+  for module, heavy in TARGETS.items():
+    seconds, loaded = time_import(module, heavy, args.repeat)
+    report[module] = {'seconds': round(seconds, 4), 'heavy_loaded': loaded}
+    if loaded or seconds > args.max_seconds:
+      failed = True
+    print(f"{module:45s} {seconds * 1000:8.1f} ms  {'heavy: ' + ', '.join(loaded) if loaded else ''}")
+
+  print(json.dumps(report))
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()
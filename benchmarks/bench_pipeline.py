@@ -0,0 +1,221 @@
+#Pipeline benchmark on a synthetic TIMIT shaped corpus: python benchmarks/bench_pipeline.py [--dr 8] [--speakers 4]
+#[--utterances 10] [--repeat 3] [--output results.json] [--compare baseline.json] [--stages asr,alignment,...]
+#Generates the corpus (see synthetic_timit.py) in a temporary folder, times every stage of the assessment with the
+#deterministic stub models and writes the timings with the commit they were measured on as JSON, so runs of two
+#commits can be compared (--compare prints the ratio of every stage to a previous result file).
+#Runs offline with numpy/pandas only, stages needing an optional dependency missing here are reported as skipped.
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_timit import make_corpus, make_noise, stub_phn_model, stub_txt_model
+
+STAGES = ['index', 'index_cached', 'manifest', 'read_phn', 'decode', 'mapping', 'asr', 'alignment', 'aggregation',
+          'accumulator', 'noise', 'plotting', 'conversion']
+
+def git_commit():
+  ### Returns (commit of the package, True if the working tree has changes), (None, None) outside of a git repository
+  try:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    status = subprocess.run(['git', 'status', '--porcelain', '--', 'asrassessment'], cwd = ROOT, capture_output = True,
+                            text = True, check = True).stdout
+    return commit, bool(status.strip())
+  except (OSError, subprocess.CalledProcessError):
+    return None, None
+
+def time_stage(run, repeat = 3):
+
+  ### <Purpose of function>: Time run() repeat times
+  ### <Output variable>:     Returns (dictionary of timings in seconds, output of the last run)
+  seconds = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    output = run()
+    seconds.append(time.perf_counter() - start)
+  return {'min': min(seconds), 'median': float(np.median(seconds)), 'runs': seconds}, output
+
+class Pipeline:
+
+  ### <Purpose of class>: Every stage of the assessment on one synthetic corpus, each stage using the outputs of the
+  ###                     previous ones (i.e. alignment scores the outputs of the asr stage)
+
+  def __init__(self, corpus, work_dir, noise_files = 8):
+    self.corpus = corpus
+    self.work_dir = work_dir
+    self.noise_files = noise_files
+
+  def index(self):
+    from asrassessment.utils.timit_load import TIMIT_file
+    self.TIMIT_dict = TIMIT_file(self.corpus, use_index = False)
+    return {'utterances': sum(len(speaker['wav']) for DRs in self.TIMIT_dict.values()
+                              for speakers in DRs.values() for speaker in speakers.values())}
+
+  def index_cached(self):
+    from asrassessment.utils.timit_load import TIMIT_file
+    return {'sets': len(TIMIT_file(self.corpus, index_path = os.path.join(self.work_dir, 'timit_index.json')))}
+
+  def manifest(self):
+    from asrassessment.utils.manifest import build_manifest
+    self.manifest_df = build_manifest(self.TIMIT_dict)
+    return {'rows': len(self.manifest_df), 'hours': round(float(self.manifest_df['duration'].sum()) / 3600, 4)}
+
+  def read_phn(self):
+    from asrassessment.utils.standardizer import read_phn_bulk
+    self.phn_dict = read_phn_bulk(self.TIMIT_dict['train'], string = True)
+    return {'files': len(self.phn_dict)}
+
+  def decode(self):
+    from asrassessment.utils.data_input import read_audio
+    samples = 0
+    for file_dir in self.manifest_df['wav']:
+      audio, fs = read_audio(file_dir, dtype = 'float32')
+      samples += len(audio)
+    return {'samples': samples}
+
+  def mapping(self):
+    from asrassessment.utils.standardizer import TIMIT_to_IPA_list
+    from asrassessment.utils.inventory import phone_inventory
+    self.refs = TIMIT_to_IPA_list(list(self.phn_dict.values()))
+    return {'phonemes': int(sum(len(ids) for ids in phone_inventory.encode_list(self.refs)))}
+
+  def asr(self):
+    from asrassessment.utils.phone_error_rate import load_asr_dict
+    self.asr_dict = load_asr_dict(self.TIMIT_dict, stub_phn_model, file_set = 'train')
+    return {'files': sum(len(speaker['phn']) for speakers in self.asr_dict['train'].values() for speaker in speakers.values())}
+
+  def alignment(self):
+    from asrassessment.utils.standardizer import IPA_to_TIMIT_list
+    from asrassessment.utils.phone_error_rate import error_rate_batch
+    hyps = IPA_to_TIMIT_list([phn for speakers in self.asr_dict['train'].values() for speaker in speakers.values()
+                              for phn in speaker['phn']])
+    totals, per_file = error_rate_batch(self.refs, hyps, processes = 1)
+    return {key: (round(float(value), 6) if isinstance(value, (float, np.floating)) else int(value)) for key, value in totals.items()}
+
+  def aggregation(self):
+    from asrassessment.utils.phone_error_rate import compare_phonemes_perc
+    self.phn_counter_dict = compare_phonemes_perc(self.TIMIT_dict, self.asr_dict, file_set = 'train')
+    return {'values': sum(len(values) for values in self.phn_counter_dict.values())}
+
+  def accumulator(self):
+    from asrassessment.utils.phone_error_rate import compare_phonemes_perc
+    self.phn_accumulator = compare_phonemes_perc(self.TIMIT_dict, self.asr_dict, file_set = 'train', accumulator = True)
+    return {'json_bytes': len(json.dumps(self.phn_accumulator.to_dict()))}
+
+  def noise(self):
+    import asrassessment
+    from asrassessment.utils.phone_error_rate import compare_phn_wrd_noise_multi
+    np.random.seed(0)
+    rows = self.manifest_df[self.manifest_df['set'] == 'train'].head(self.noise_files)
+    result = compare_phn_wrd_noise_multi(rows, os.path.join(self.corpus, 'noise.wav'),
+                                         os.path.join(os.path.dirname(asrassessment.__file__), 'noisyspeech.cfg'),
+                                         stub_phn_model, stub_txt_model, softer_volumes = [0, 10, 20], file_set = 'train')
+    return {'files': len(rows), 'mean_error_rate': result.groupby(['Volume', 'Type of Error'])['Error Rate (%)'].mean().round(4).to_dict()}
+
+  def plotting(self):
+    from asrassessment.main import phn_boxplot
+    fig = phn_boxplot(self.phn_accumulator, export_path = None, show = False)
+    return {'traces': len(fig.data)}
+
+  def conversion(self):
+    from asrassessment.utils.corpus_convert import convert_corpus
+    output_directory = os.path.join(self.work_dir, 'converted')
+    shutil.rmtree(output_directory, ignore_errors = True)
+    convert_corpus(self.corpus, output_directory, workers = 1)
+    return {'files': sum(len(files) for root, dirs, files in os.walk(output_directory))}
+
+def _result_values(value):
+  #json keys of the stage outputs (i.e. tuples of groupby keys)
+  if isinstance(value, dict):
+    return {str(key): _result_values(item) for key, item in value.items()}
+  return value
+
+def compare(report, baseline):
+  ### print the time of every stage of report relative to baseline (< 1 is faster)
+  if baseline.get('corpus') != report['corpus']:
+    print(f"different corpus: {baseline.get('corpus')} (baseline) and {report['corpus']}")
+  print(f"{'stage':15s} {'baseline (s)':>13s} {'now (s)':>10s} {'ratio':>8s}")
+  for stage, result in report['stages'].items():
+    old = baseline.get('stages', {}).get(stage, {})
+    if 'seconds' not in result or 'seconds' not in old:
+      continue
+    before, after = old['seconds']['min'], result['seconds']['min']
+    print(f"{stage:15s} {before:13.4f} {after:10.4f} {after / before if before else float('nan'):8.2f}")
+    if old.get('result') != result.get('result'):
+      print(f"{'':15s} output changed: {old.get('result')} -> {result.get('result')}")
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--dr', type = int, default = 8)
+  parser.add_argument('--speakers', type = int, default = 4)
+  parser.add_argument('--utterances', type = int, default = 10)
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--noise-files', type = int, default = 8)
+  parser.add_argument('--repeat', type = int, default = 3)
+  parser.add_argument('--stages', default = ",".join(STAGES))
+  parser.add_argument('--output', help = 'JSON file for the results (default: printed)')
+  parser.add_argument('--compare', help = 'JSON results of a previous run to compare with')
+  parser.add_argument('--keep', help = 'folder to generate (or reuse) the corpus in, kept after the run')
+  args = parser.parse_args()
+
+  #stages run in the order of STAGES, the stages they depend on always run
+  selected = [stage for stage in STAGES if stage in args.stages.split(',')]
+  work_dir = tempfile.mkdtemp(prefix = 'asrassessment_bench_')
+  corpus = args.keep or os.path.join(work_dir, 'corpus')
+  os.environ.setdefault('XDG_CACHE_HOME', os.path.join(work_dir, 'cache'))
+
+  commit, dirty = git_commit()
+  report = {'commit': commit, 'dirty': dirty, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'corpus': {'dr': args.dr, 'speakers': args.speakers, 'utterances': args.utterances, 'seed': args.seed},
+            'repeat': args.repeat, 'stages': {}}
+  try:
+    if not os.path.isdir(os.path.join(corpus, 'train')):
+      start = time.perf_counter()
+      make_corpus(corpus, n_dr = args.dr, speakers = args.speakers, utterances = args.utterances, seed = args.seed)
+      make_noise(os.path.join(corpus, 'noise.wav'), seed = args.seed)
+      report['generate_seconds'] = time.perf_counter() - start
+
+    pipeline = Pipeline(corpus, work_dir, noise_files = args.noise_files)
+    needed = {'manifest': ['index'], 'read_phn': ['index'], 'decode': ['index', 'manifest'],
+              'mapping': ['index', 'read_phn'], 'asr': ['index'], 'alignment': ['index', 'read_phn', 'mapping', 'asr'],
+              'aggregation': ['index', 'asr'], 'accumulator': ['index', 'asr'], 'noise': ['index', 'manifest'],
+              'plotting': ['index', 'asr', 'accumulator']}
+    done = set()
+    for stage in selected:
+      for dependency in needed.get(stage, []):
+        if dependency not in done:
+          getattr(pipeline, dependency)()
+          done.add(dependency)
+      try:
+        seconds, result = time_stage(getattr(pipeline, stage), repeat = args.repeat)
+        report['stages'][stage] = {'seconds': seconds, 'result': _result_values(result)}
+        done.add(stage)
+      except ImportError as error:
+        report['stages'][stage] = {'skipped': str(error)}
+      print(f"{stage:15s} {json.dumps(report['stages'][stage].get('seconds', {}).get('min', 'skipped'))}", file = sys.stderr)
+  finally:
+    shutil.rmtree(work_dir, ignore_errors = True)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent = 2)
+  else:
+    print(json.dumps(report, indent = 2))
+  if args.compare:
+    with open(args.compare) as f:
+      compare(report, json.load(f))
+
+if __name__ == '__main__':
+  main()
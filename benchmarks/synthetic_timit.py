@@ -0,0 +1,190 @@
+#Synthetic TIMIT shaped corpus and deterministic stub ASR models for the benchmarks (numpy only, no download)
+#python benchmarks/synthetic_timit.py <output folder> [--dr 8] [--speakers 4] [--utterances 10] [--seed 0]
+#
+#Every phoneme is a sine tone of its own frequency lasting 1-2 frames of FRAME samples, words are separated by one
+#silent frame and every utterance starts and ends with h# silence. The stub models decode the tones back frame by
+#frame, so on the clean corpus they only miss the h# silences (empty phonemes after TIMIT_to_IPA, as with TIMIT)
+#and they make more errors the louder the added noise is.
+
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asrassessment.utils.standardizer import IPA_to_TIMIT_mapping, TIMIT_to_IPA_mapping
+from asrassessment.utils.scheduler import audio_input
+
+FS = 16000
+FRAME = 800
+BIN_HZ = FS / FRAME
+
+#TIMIT phonemes the stub can output as IPA and which TIMIT_to_IPA keeps as they are (so clean scores are exact)
+IPA_OF = {}
+for ipa, timit in IPA_to_TIMIT_mapping.items():
+  if TIMIT_to_IPA_mapping.get(timit, timit) == timit and timit.isalpha():
+    IPA_OF.setdefault(timit, ipa)
+PHONEMES = sorted(IPA_OF)
+
+#tone of every phoneme, on an FFT bin of a FRAME samples frame
+FREQS = 200 + 3 * BIN_HZ * np.arange(len(PHONEMES))
+
+def _lexicon(rng, n_words):
+  #words as phoneme sequences without the same phoneme twice in a row, spelled by joining the phonemes
+  lexicon = {}
+  while len(lexicon) < n_words:
+    phonemes = [PHONEMES[rng.integers(len(PHONEMES))]]
+    length = rng.integers(2, 6)
+    while len(phonemes) < length:
+      phoneme = PHONEMES[rng.integers(len(PHONEMES))]
+      if phoneme != phonemes[-1]:
+        phonemes.append(phoneme)
+    lexicon.setdefault("".join(phonemes), phonemes)
+  return lexicon
+
+def _write_sphere(path, samples, fs = FS):
+  #NIST SPHERE file (1024 byte header, little endian 16 bit PCM) as the original TIMIT .WAV files
+  header = (f"NIST_1A\n   1024\ndatabase_id -s5 TIMIT\nsample_count -i {len(samples)}\nsample_rate -i {fs}\n"
+            "channel_count -i 1\nsample_byte_format -s2 01\nsample_n_bytes -i 2\nsample_sig_bits -i 16\n"
+            "sample_coding -s3 pcm\nend_head\n").encode().ljust(1024, b' ')
+  with open(path, 'wb') as f:
+    f.write(header)
+    f.write(samples.astype('<i2').tobytes())
+
+def _write_riff(path, samples, fs = FS):
+  import wave
+  with wave.open(path, 'wb') as f:
+    f.setnchannels(1)
+    f.setsampwidth(2)
+    f.setframerate(fs)
+    f.writeframes(samples.astype('<i2').tobytes())
+
+def _utterance(rng, lexicon, words):
+
+  ### Returns (int16 samples, phn rows, wrd rows) of one utterance of words
+  frames = [('h#', 2)]
+  wrd = []
+  position = 2
+  for i, word in enumerate(words):
+    if i:
+      frames.append((None, 1))
+      position += 1
+    start = position
+    for phoneme in lexicon[word]:
+      n_frames = int(rng.integers(1, 3))
+      frames.append((phoneme, n_frames))
+      position += n_frames
+    wrd.append((start * FRAME, position * FRAME, word))
+  #at least 1 s (.txt sample numbers of 5 digits, see compare_phn_wrd_noise, up to max_words = 10)
+  frames.append(('h#', max(2, FS // FRAME - position)))
+
+  t = np.arange(FRAME) / FS
+  samples, phn, position = [], [], 0
+  for phoneme, n_frames in frames:
+    length = n_frames * FRAME
+    if phoneme is None or phoneme == 'h#':
+      samples.append(rng.normal(0, 30, length))
+    else:
+      tone = np.sin(2 * np.pi * FREQS[PHONEMES.index(phoneme)] * t)
+      samples.append(np.tile(tone, n_frames) * rng.uniform(3000, 12000) + rng.normal(0, 30, length))
+    if phoneme is not None:
+      phn.append((position, position + length, phoneme))
+    position += length
+  return np.clip(np.concatenate(samples), -32768, 32767).astype(np.int16), phn, wrd
+
+def make_corpus(output_directory, n_dr = 8, speakers = 4, utterances = 10, test_fraction = 0.25, n_words = 300,
+                max_words = 8, seed = 0, capital = False, sphere = True):
+
+  ### <Purpose of function>: Write a synthetic corpus with the TIMIT layout: <set>/<dr>/<speaker>/<utterance>.wav/.phn/.txt/.wrd
+  ### <Input variables>:     n_dr/speakers/utterances = number of dialect regions, speakers per dialect region (and set)
+  ###                                                   and utterances per speaker
+  ###                        test_fraction = size of the test set relative to the train set (speakers per DR)
+  ###                        n_words/max_words = vocabulary size and maximum number of words per utterance
+  ###                        seed = seed of every random choice (same arguments, same corpus)
+  ###                        capital = upper case names (TRAIN/DR1/FCJF0/SA1.WAV), see timit_load.TIMIT_file
+  ###                        sphere = True for NIST SPHERE .wav files as TIMIT, False for RIFF .wav files
+  ### <Output variable>:     Returns the lexicon {word: list of phonemes} used by the stub models
+
+  rng = np.random.default_rng(seed)
+  lexicon = _lexicon(rng, n_words)
+  vocabulary = sorted(lexicon)
+  name = str.upper if capital else str.lower
+  write = _write_sphere if sphere else _write_riff
+
+  for file_set, n_speakers in [('train', speakers), ('test', max(1, int(round(speakers * test_fraction))))]:
+    for dr in range(1, n_dr + 1):
+      for spk in range(n_speakers):
+        speaker = f"{'fm'[spk % 2]}{''.join(chr(97 + c) for c in rng.integers(26, size = 3))}{spk}"
+        speaker_dir = os.path.join(output_directory, name(file_set), name(f"dr{dr}"), name(speaker))
+        os.makedirs(speaker_dir, exist_ok = True)
+        for i in range(utterances):
+          utterance = ['sa1', 'sa2'][i] if i < 2 else (f"si{1000 + i}" if i % 2 == 0 else f"sx{100 + i}")
+          words = [vocabulary[j] for j in rng.integers(len(vocabulary), size = int(rng.integers(2, max_words + 1)))]
+          samples, phn, wrd = _utterance(rng, lexicon, words)
+          base = os.path.join(speaker_dir, name(utterance))
+          write(f"{base}.{name('wav')}", samples)
+          with open(f"{base}.{name('phn')}", 'w') as f:
+            f.writelines(f"{start} {end} {phoneme}\n" for start, end, phoneme in phn)
+          with open(f"{base}.{name('wrd')}", 'w') as f:
+            f.writelines(f"{start} {end} {word}\n" for start, end, word in wrd)
+          with open(f"{base}.{name('txt')}", 'w') as f:
+            f.write(f"0 {len(samples)} {' '.join(words)}\n")
+  return lexicon
+
+def make_noise(path, seconds = 5, seed = 0):
+  ### white noise .wav file for the noise benchmarks
+  rng = np.random.default_rng(seed)
+  _write_riff(path, np.clip(rng.normal(0, 4000, int(seconds * FS)), -32768, 32767).astype(np.int16))
+  return path
+
+def decode_words(audio):
+
+  ### <Purpose of function>: Decode the tones of a synthetic utterance (float or int16 samples)
+  ### <Output variable>:     Returns list of words, each a list of TIMIT phonemes (silent frames split the words)
+  audio = np.asarray(audio, dtype = np.float64)
+  frames = audio[:len(audio) // FRAME * FRAME].reshape(-1, FRAME)
+  energy = np.sqrt((frames ** 2).mean(axis = 1))
+  voiced = energy > 0.1 * energy.max() if len(energy) else energy
+  peaks = np.abs(np.fft.rfft(frames, axis = 1)).argmax(axis = 1)
+  index = np.clip(np.round((peaks * BIN_HZ - FREQS[0]) / (FREQS[1] - FREQS[0])).astype(np.int64), 0, len(PHONEMES) - 1)
+
+  words, word, previous = [], [], None
+  for is_voiced, i in zip(voiced, index):
+    if not is_voiced:
+      if word:
+        words.append(word)
+      word, previous = [], None
+    elif i != previous:
+      word.append(PHONEMES[i])
+      previous = i
+  if word:
+    words.append(word)
+  return words
+
+@audio_input('float32')
+def stub_phn_model(audio):
+  ### deterministic stub phoneme model: '/' joined IPA phonemes, as the ASR models of the package examples
+  return "/".join(IPA_OF[phoneme] for word in decode_words(audio) for phoneme in word)
+
+@audio_input('float32')
+def stub_txt_model(audio):
+  ### deterministic stub word model: words spelled as in the synthetic lexicon
+  return " ".join("".join(word) for word in decode_words(audio))
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('output')
+  parser.add_argument('--dr', type = int, default = 8)
+  parser.add_argument('--speakers', type = int, default = 4)
+  parser.add_argument('--utterances', type = int, default = 10)
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--capital', action = 'store_true')
+  parser.add_argument('--riff', action = 'store_true', help = 'RIFF .wav files instead of NIST SPHERE')
+  args = parser.parse_args()
+  make_corpus(args.output, n_dr = args.dr, speakers = args.speakers, utterances = args.utterances, seed = args.seed,
+              capital = args.capital, sphere = not args.riff)
+  make_noise(os.path.join(args.output, 'noise.wav'), seed = args.seed)
+
+if __name__ == '__main__':
+  main()
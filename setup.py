@@ -26,7 +26,6 @@ setup(
                         'scipy>=1.9.0',
                         'numpy>=1.23.1',
                         'pandas>=1.4.3',
-                        'sklearn>=0.0',
                         'pydub>=0.25.1',
                         'soundfile>=0.10.2',
                         'plotly>=5.8.0',
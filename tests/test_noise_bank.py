@@ -0,0 +1,31 @@
+import wave
+import pickle
+import numpy as np
+import pytest
+
+from asrassessment.utils.noise_bank import NoiseBank
+
+@pytest.fixture
+def noise_file(tmp_path):
+  path = str(tmp_path / 'noise.wav')
+  samples = np.random.default_rng(0).normal(0, 4000, 16000).clip(-32768, 32767).astype('<i2')
+  with wave.open(path, 'wb') as f:
+    f.setnchannels(1)
+    f.setsampwidth(2)
+    f.setframerate(16000)
+    f.writeframes(samples.tobytes())
+  return path
+
+def test_segment_is_read_only_view(noise_file):
+  bank = NoiseBank(noise_file)
+  segment = bank.segment(1000, offset = 100)
+  assert np.shares_memory(segment, bank.buffer)
+  assert not segment.flags.writeable
+  with pytest.raises(ValueError):
+    segment *= 2
+
+def test_pickled_and_shared_buffer_is_read_only(noise_file, tmp_path):
+  bank = NoiseBank(noise_file)
+  assert not pickle.loads(pickle.dumps(bank)).buffer.flags.writeable
+  shared = bank.share(str(tmp_path / 'bank.npy'))
+  assert not pickle.loads(pickle.dumps(shared)).segment(1000).flags.writeable